@@ -1,10 +1,12 @@
 from django.conf import settings
 import requests
+from requests.adapters import HTTPAdapter
 import base64
 import logging
 import urllib.parse
 import time
-from django.core.cache import cache
+from ..deadline import DeadlineExceeded
+from ..request_cache import cache
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +22,10 @@ class SpotifyAuthError(SpotifyAPIError):
 class SpotifyRequestError(SpotifyAPIError):
     """Raised when a request to Spotify API fails."""
 
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code  # None for network errors
+
 
 # SpotifyAPIClient is a client for interacting with the Spotify Web API.
     # It literally deals with low-level API requests, no business logic - that lives in `services/spotify_service.py`.
@@ -31,13 +37,56 @@ class SpotifyAPIClient:
     CLIENT_TOKEN_KEY = "spotify_client_access_token"
     CLIENT_TOKEN_EXPIRY_KEY = "spotify_client_token_expires_at"
 
+    # Keep-alive connections per host (accounts.spotify.com, api.spotify.com)
+    POOL_MAXSIZE = 10
+
+    # Upper bound for any single call (seconds) - a request Deadline can only make it shorter
+    DEFAULT_TIMEOUT = 10
+
     def __init__(self):
         self.client_id = settings.SPOTIFY_CLIENT_ID
         self.client_secret = settings.SPOTIFY_CLIENT_SECRET
+        self.session = self.build_session()
+
+# Pooled HTTP session, so repeated calls reuse TCP/TLS connections instead of handshaking every time.
+    def build_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.POOL_MAXSIZE)
+        session.mount("https://", adapter)
+        return session
+
+# Open (or re-open) the pooled connections to Spotify ahead of the first real request.
+    # Any HTTP status is fine here - we only care about the TCP/TLS handshake being done.
+    def open_connections(self):
+        logger.info("SpotifyAPIClient.open_connections() called")
+
+        for url in (self.TOKEN_URL, self.BASE_URL):
+            try:
+                self.session.head(url, timeout=5)
+            except requests.RequestException as e:
+                logger.warning(f"Could not pre-open connection to {url}: {str(e)}")
+
+# Timeout for the next call: DEFAULT_TIMEOUT, or whatever is left of the request's deadline.
+    # Raises DeadlineExceeded (without calling Spotify) when the budget is already spent.
+    def request_timeout(self, deadline=None):
+        if deadline is None:
+            return self.DEFAULT_TIMEOUT
+        return deadline.timeout(self.DEFAULT_TIMEOUT)
+
+# A timeout/network error after the deadline ran out is the budget's doing, not Spotify's - report it as such.
+    def raise_if_deadline_exceeded(self, deadline, error):
+        if deadline is not None and deadline.expired():
+            raise DeadlineExceeded("Request budget ran out while waiting for Spotify") from error
+
+# Drop all pooled connections - must be called before forking, sockets can't be shared between processes.
+    def close(self):
+        logger.info("SpotifyAPIClient.close() called")
+        self.session.close()
+        self.session = self.build_session()
 
 # Get an OAuth access token using client credentials.
     # This method is used to authenticate the client and obtain an access token.
-    def authenticate_client(self):
+    def authenticate_client(self, deadline=None):
         logger.info("SpotifyAPIClient.authenticate_client() called")
 
         try:
@@ -50,7 +99,7 @@ class SpotifyAPIClient:
             }
             data = {"grant_type": "client_credentials"}
 
-            response = requests.post(self.TOKEN_URL, headers=headers, data=data)
+            response = self.session.post(self.TOKEN_URL, headers=headers, data=data, timeout=self.request_timeout(deadline))
             response.raise_for_status()
 
             response_data = response.json()
@@ -60,24 +109,25 @@ class SpotifyAPIClient:
             expires_at = time.time() + expires_in
 
             # Cache token and expiry
-            cache.set(self.CLIENT_TOKEN_KEY, access_token, timeout=expires_in)
-            cache.set(self.CLIENT_TOKEN_EXPIRY_KEY, expires_at, timeout=expires_in)
+            cache.set_many({self.CLIENT_TOKEN_KEY: access_token, self.CLIENT_TOKEN_EXPIRY_KEY: expires_at}, timeout=expires_in)
 
             logger.info("Spotify client access token refreshed and cached")
             return access_token
 
         except requests.RequestException as e:
+            self.raise_if_deadline_exceeded(deadline, e)
             logger.exception("Failed to authenticate with Spotify")
             raise SpotifyAuthError("Failed to authenticate with Spotify") from e
 
 # Helper function to get clients access token, and if need be, refresh it.
-    def get_client_access_token(self):
-        access_token = cache.get(self.CLIENT_TOKEN_KEY)
-        expires_at = cache.get(self.CLIENT_TOKEN_EXPIRY_KEY)
+    def get_client_access_token(self, deadline=None):
+        cached = cache.get_many([self.CLIENT_TOKEN_KEY, self.CLIENT_TOKEN_EXPIRY_KEY])
+        access_token = cached.get(self.CLIENT_TOKEN_KEY)
+        expires_at = cached.get(self.CLIENT_TOKEN_EXPIRY_KEY)
 
         if not access_token or not expires_at or time.time() >= expires_at:
             logger.info("Cached token missing or expired — refreshing")
-            return self.authenticate_client()
+            return self.authenticate_client(deadline)
 
         return access_token
 
@@ -130,7 +180,7 @@ class SpotifyAPIClient:
             }
             headers = {"Content-Type": "application/x-www-form-urlencoded"}
 
-            response = requests.post(self.TOKEN_URL, data=data, headers=headers)
+            response = self.session.post(self.TOKEN_URL, data=data, headers=headers, timeout=self.DEFAULT_TIMEOUT)
             response.raise_for_status()
             token_data = response.json()
 
@@ -154,7 +204,7 @@ class SpotifyAPIClient:
 
 # Refresh the user's access token using their refresh token - for auth users.
     # This method is used to obtain a new access token when the current one expires.
-    def refresh_access_token(self, refresh_token):
+    def refresh_access_token(self, refresh_token, deadline=None):
         """
         Refresh the user's access token using their refresh token.
         """
@@ -171,7 +221,7 @@ class SpotifyAPIClient:
                 "Content-Type": "application/x-www-form-urlencoded"
             }
 
-            response = requests.post(self.TOKEN_URL, data=data, headers=headers)
+            response = self.session.post(self.TOKEN_URL, data=data, headers=headers, timeout=self.request_timeout(deadline))
             response.raise_for_status()
             token_data = response.json()
 
@@ -184,11 +234,12 @@ class SpotifyAPIClient:
             }
 
         except requests.RequestException as e:
+            self.raise_if_deadline_exceeded(deadline, e)
             logger.exception("Error refreshing Spotify user access token")
             raise SpotifyAuthError("Failed to refresh user access token") from e
 
 
-    def search_artists_by_genre(self, genre, access_token, limit=20):
+    def search_artists_by_genre(self, genre, access_token, limit=20, deadline=None):
         """
         Search for artists by genre.
         """
@@ -201,21 +252,46 @@ class SpotifyAPIClient:
         url = f"{self.BASE_URL}/search?q={encoded_query}&type=artist&limit={limit}"
 
         try:
-            response = requests.get(url, headers=self.build_headers(access_token))
+            response = self.session.get(url, headers=self.build_headers(access_token), timeout=self.request_timeout(deadline))
             response.raise_for_status()
             logger.debug(f"Search results: {response.json()}")
             return response.json()["artists"]["items"]
 
         except requests.HTTPError as e:
             logger.error(f"HTTP error in search_artists_by_genre: {e.response.status_code} {e.response.text}")
-            raise SpotifyRequestError(f"Failed to search artists: {e.response.status_code}") from e
+            raise SpotifyRequestError(f"Failed to search artists: {e.response.status_code}", e.response.status_code) from e
 
         except requests.RequestException as e:
+            self.raise_if_deadline_exceeded(deadline, e)
             logger.exception("Network error during search_artists_by_genre")
             raise SpotifyRequestError("Network error during search_artists_by_genre") from e
 
 
-    def fetch_artist_details(self, artist_id, access_token):
+    def search_artists_by_name(self, name, access_token, limit=10, deadline=None):
+        """
+        Search for artists by (partial) name.
+        """
+        logger.info(f"SpotifyAPIClient.search_artists_by_name('{name}') called")
+
+        params = urllib.parse.urlencode({"q": name, "type": "artist", "limit": limit})
+        url = f"{self.BASE_URL}/search?{params}"
+
+        try:
+            response = self.session.get(url, headers=self.build_headers(access_token), timeout=self.request_timeout(deadline))
+            response.raise_for_status()
+            return response.json()["artists"]["items"]
+
+        except requests.HTTPError as e:
+            logger.error(f"HTTP error in search_artists_by_name: {e.response.status_code} {e.response.text}")
+            raise SpotifyRequestError(f"Failed to search artists: {e.response.status_code}", e.response.status_code) from e
+
+        except requests.RequestException as e:
+            self.raise_if_deadline_exceeded(deadline, e)
+            logger.exception("Network error during search_artists_by_name")
+            raise SpotifyRequestError("Network error during search_artists_by_name") from e
+
+
+    def fetch_artist_details(self, artist_id, access_token, deadline=None):
         """
         Get details of a specific artist by Spotify ID.
         """
@@ -223,20 +299,21 @@ class SpotifyAPIClient:
 
         url = f"{self.BASE_URL}/artists/{artist_id}"
         try:
-            response = requests.get(url, headers=self.build_headers(access_token))
+            response = self.session.get(url, headers=self.build_headers(access_token), timeout=self.request_timeout(deadline))
             response.raise_for_status()
             logger.debug(f"Artist details: {response.json()}")
             return response.json()
         except requests.HTTPError as e:
             logger.error(f"HTTP error in fetch_artist_details: {e.response.status_code} {e.response.text}")
-            raise SpotifyRequestError(f"Failed to fetch artist details: {e.response.status_code}") from e
+            raise SpotifyRequestError(f"Failed to fetch artist details: {e.response.status_code}", e.response.status_code) from e
         except requests.RequestException as e:
+            self.raise_if_deadline_exceeded(deadline, e)
             logger.exception("Network error during fetch_artist_details")
             raise SpotifyRequestError("Network error during fetch_artist_details") from e
 
 # Get the current user's profile information using their access token - retrieved from `exchange_code_for_token()`.
     # This method retrieves the user's profile data from Spotify.
-    def get_user_profile(self, access_token):
+    def get_user_profile(self, access_token, deadline=None):
         """
         Fetch the current Spotify user's profile using their access token.
         """
@@ -245,7 +322,7 @@ class SpotifyAPIClient:
         url = f"{self.BASE_URL}/me"
 
         try:
-            response = requests.get(url, headers=self.build_headers(access_token))
+            response = self.session.get(url, headers=self.build_headers(access_token), timeout=self.request_timeout(deadline))
             response.raise_for_status()
             user_data = response.json()
             logger.debug(f"Fetched user profile: {user_data}")
@@ -253,14 +330,15 @@ class SpotifyAPIClient:
 
         except requests.HTTPError as e:
             logger.error(f"HTTP error fetching user profile: {e.response.status_code} {e.response.text}")
-            raise SpotifyRequestError(f"Failed to fetch user profile: {e.response.status_code}") from e
+            raise SpotifyRequestError(f"Failed to fetch user profile: {e.response.status_code}", e.response.status_code) from e
 
         except requests.RequestException as e:
+            self.raise_if_deadline_exceeded(deadline, e)
             logger.exception("Network error during get_user_profile")
             raise SpotifyRequestError("Network error during get_user_profile") from e
 
 
-    def get_user_top_artists(self, access_token, limit=20, time_range="long_term"):
+    def get_user_top_artists(self, access_token, limit=20, time_range="long_term", deadline=None):
         """
         Fetch user's top artists from Spotify API.
         """
@@ -269,11 +347,16 @@ class SpotifyAPIClient:
         url = f"{self.BASE_URL}/me/top/artists?limit={limit}&time_range={time_range}"
         
         try:
-            response = requests.get(url, headers=self.build_headers(access_token))
+            response = self.session.get(url, headers=self.build_headers(access_token), timeout=self.request_timeout(deadline))
             response.raise_for_status()
             return response.json()
         
         except requests.HTTPError as e:
             logger.error(f"HTTP error in get_user_top_artists: {e.response.status_code} {e.response.text}")
-            raise SpotifyRequestError("Failed to fetch user’s top artists")
+            raise SpotifyRequestError("Failed to fetch user’s top artists", e.response.status_code) from e
+
+        except requests.RequestException as e:
+            self.raise_if_deadline_exceeded(deadline, e)
+            logger.exception("Network error during get_user_top_artists")
+            raise SpotifyRequestError("Network error during get_user_top_artists") from e
     
@@ -0,0 +1,6 @@
+from .views import spotify_service
+
+
+# Login state for base.html, resolved without loading a session for anonymous visitors.
+def spotify_auth(request):
+    return {"is_spotify_authenticated": spotify_service.is_authenticated(request)}
@@ -0,0 +1,31 @@
+import time
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request's time budget runs out before (or during) an outbound call."""
+
+
+# Time budget for one request, passed down from the view through the service to the client.
+    # Every outbound call uses only what is left of it, so a slow Spotify can't hold a worker past the budget.
+class Deadline:
+    # Not worth starting a call with less than this left - it would just time out
+    MIN_CALL_TIMEOUT = 0.05  # seconds
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() < self.MIN_CALL_TIMEOUT
+
+    def timeout(self, cap):
+        """
+        Timeout for the next outbound call: what's left of the budget, at most `cap` seconds.
+        """
+        remaining = self.remaining()
+        if remaining < self.MIN_CALL_TIMEOUT:
+            raise DeadlineExceeded(f"Request budget of {self.seconds}s is spent")
+        return min(cap, remaining)
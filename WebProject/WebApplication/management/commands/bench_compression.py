@@ -0,0 +1,86 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+
+from WebApplication.middleware import CompressionMiddleware
+
+
+# Measures bytes on the wire and CPU time added by CompressionMiddleware for our real templates.
+    # Run it on the production box: `python manage.py bench_compression --artists 20 --iterations 500`
+class Command(BaseCommand):
+    help = "Benchmark HTML minification + brotli/gzip compression of rendered pages"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--artists", type=int, default=20, help="Artists rendered per page")
+        parser.add_argument("--iterations", type=int, default=300, help="Responses compressed per measurement")
+        parser.add_argument("--workers", type=int, default=4, help="Gunicorn workers to extrapolate throughput for")
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        pages = self.render_pages(factory, options["artists"])
+
+        self.stdout.write(
+            f"{'page':<10}{'encoding':<10}{'raw B':>9}{'wire B':>9}{'saved':>8}{'ms/resp':>9}{'resp/s x' + str(options['workers']):>14}"
+        )
+
+        for page_name, html in pages.items():
+            for encoding in ("identity", "gzip", "br"):
+                request = factory.get("/", HTTP_ACCEPT_ENCODING=encoding)
+                middleware = CompressionMiddleware(lambda req: HttpResponse(html))
+
+                started = time.perf_counter()
+                for _ in range(options["iterations"]):
+                    response = middleware(request)
+                elapsed = (time.perf_counter() - started) / options["iterations"]
+
+                raw_size = len(html.encode())
+                wire_size = len(response.content)
+                saved = 100 * (1 - wire_size / raw_size)
+                throughput = options["workers"] / elapsed if elapsed else float("inf")
+
+                self.stdout.write(
+                    f"{page_name:<10}{encoding:<10}{raw_size:>9}{wire_size:>9}{saved:>7.1f}%{elapsed * 1000:>9.3f}{throughput:>14.0f}"
+                )
+
+    def render_pages(self, factory, artist_count):
+        """
+        Render landing/home/artist templates with realistic fake data.
+        """
+        request = factory.get("/")
+        request.session = {}
+
+        artists = [
+            {
+                "spotify_id": f"{index:022d}",
+                "name": f"Benchmark Artist {index}",
+                "popularity": 100 - index % 100,
+                "genres": ["metal", "progressive metal", "djent"],
+                "followers": 123456 + index,
+                "image_url": f"https://i.scdn.co/image/ab6761610000e5eb{index:024x}",
+                "external_url": f"https://open.spotify.com/artist/{index:022d}",
+            }
+            for index in range(artist_count)
+        ]
+        user_profile = {
+            "display_name": "Benchmark User",
+            "profile_url": "https://open.spotify.com/user/benchmark",
+            "image_url": "https://i.scdn.co/image/benchmark",
+            "followers": 42,
+            "country": "LT",
+        }
+
+        return {
+            "landing": render_to_string("WebApplication/landing.html", {
+                "artists": artists, "genres": ["metal", "jazz", "rock"], "genre": "metal",
+            }, request=request),
+            "home": render_to_string("WebApplication/home.html", {
+                "artists": artists, "genres": ["metal", "jazz", "rock"], "top_genre": "metal",
+                "user_profile": user_profile,
+            }, request=request),
+            "artist": render_to_string("WebApplication/artist.html", {
+                "artist": artists[0],
+            }, request=request),
+        }
@@ -0,0 +1,100 @@
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import modify_settings
+from redis.connection import AbstractConnection
+
+MIDDLEWARE = "WebApplication.middleware.RequestCacheMiddleware"
+
+
+# Redis round trips and latency per page with and without RequestCacheMiddleware (request-scoped batching),
+    # against the Redis configured in settings. Each page is requested once first so the Spotify data is cached -
+    # what's left is the cost of reading / writing it. Run it on the production box: `python manage.py bench_request_cache`
+class Command(BaseCommand):
+    help = "Benchmark Redis round trips and latency per page, with and without request-scoped cache batching"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=50, help="Requests per page and mode")
+        parser.add_argument(
+            "--rtt", type=float, default=0.0, help="Extra milliseconds per round trip, to model a remote Redis"
+        )
+        parser.add_argument("--host", default="localhost", help="Host header (must be in ALLOWED_HOSTS)")
+
+    def handle(self, *args, **options):
+        pages = self.pages(Client(HTTP_HOST=options["host"]))
+
+        self.stdout.write(
+            f"{'page':<16}{'trips':>7}{'batched':>9}{'ms':>9}{'batched':>9}{'saved':>8}"
+        )
+
+        # A Client builds its middleware chain on its first request (and keeps it) - one per mode
+        client = Client(HTTP_HOST=options["host"])
+        batched_client = Client(HTTP_HOST=options["host"])
+
+        for page_name, url in pages.items():
+            with modify_settings(MIDDLEWARE={"remove": MIDDLEWARE}):
+                trips, latency = self.measure(client, url, options["iterations"], options["rtt"])
+            with modify_settings(MIDDLEWARE={"remove": MIDDLEWARE, "prepend": MIDDLEWARE}):
+                batched_trips, batched_latency = self.measure(batched_client, url, options["iterations"], options["rtt"])
+
+            saved = 100 * (1 - batched_latency / latency) if latency else 0.0
+            self.stdout.write(
+                f"{page_name:<16}{trips:>7}{batched_trips:>9}{latency:>9.2f}{batched_latency:>9.2f}{saved:>7.1f}%"
+            )
+
+    def pages(self, client):
+        """
+        The pages to measure, after requesting each once to fill the cache.
+        """
+        pages = {
+            "landing": "/?genre_name=metal",
+            "landing x3": "/?genre_name=metal&genre_name=rock&genre_name=jazz",
+        }
+        for url in pages.values():
+            client.get(url)
+
+        artist_ids = cache.get("artists_for_genre:metal")
+        if artist_ids:
+            pages["artist"] = f"/artist/{artist_ids[0]}/"
+        pages["search"] = "/search/artists/?q=me"
+
+        for url in pages.values():
+            client.get(url)
+        return pages
+
+    def measure(self, client, url, iterations, rtt):
+        """
+        Return (median round trips, median milliseconds) per request.
+        """
+        trips, latencies = [], []
+        for _ in range(iterations):
+            with count_round_trips(rtt / 1000) as counter:
+                started = time.perf_counter()
+                client.get(url)
+                latencies.append((time.perf_counter() - started) * 1000)
+            trips.append(counter["trips"])
+
+        return statistics.median(trips), statistics.median(latencies)
+
+
+# Every command - or whole pipeline - redis-py sends goes through send_packed_command: one call, one round trip
+@contextmanager
+def count_round_trips(delay=0.0):
+    counter = {"trips": 0}
+    send_packed_command = AbstractConnection.send_packed_command
+
+    def counting(connection, *args, **kwargs):
+        counter["trips"] += 1
+        if delay:
+            time.sleep(delay)
+        return send_packed_command(connection, *args, **kwargs)
+
+    AbstractConnection.send_packed_command = counting
+    try:
+        yield counter
+    finally:
+        AbstractConnection.send_packed_command = send_packed_command
@@ -0,0 +1,65 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from WebApplication.services.genre_index import GenreCooccurrenceIndex
+from WebApplication.services.spotify_service import SpotifyService
+
+
+# Update the related-genres index now (same as the periodic update_genre_index task),
+    # or time a build on synthetic data: `python manage.py build_genre_index --benchmark 50000`
+class Command(BaseCommand):
+    help = "Update the genre co-occurrence index, or benchmark it on synthetic artists"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rebuild", action="store_true", help="Start over from the artists currently cached")
+        parser.add_argument("--benchmark", type=int, metavar="ARTISTS", help="Time a build with N synthetic artists")
+        parser.add_argument("--genres", type=int, default=6000, help="Distinct genres in the synthetic data")
+
+    def handle(self, *args, **options):
+        if options["benchmark"]:
+            self.benchmark(options["benchmark"], options["genres"])
+            return
+
+        added = SpotifyService().update_genre_index(rebuild=options["rebuild"])
+        self.stdout.write(self.style.SUCCESS(f"Genre index updated with {added} new artists"))
+
+    def benchmark(self, artist_count, genre_count):
+        rng = random.Random(42)
+        genres = [f"genre {index}" for index in range(genre_count)]
+
+        # Spotify tags are heavily skewed - a few big genres, a long tail of niche ones
+        weights = [1 / (rank + 1) for rank in range(genre_count)]
+
+        def synthetic_artists(count, offset=0):
+            return {
+                f"artist{offset + index}": rng.choices(genres, weights, k=rng.randint(1, 6))
+                for index in range(count)
+            }
+
+        artists = synthetic_artists(artist_count)
+        increment = synthetic_artists(max(artist_count // 100, 1), offset=artist_count)
+        index = GenreCooccurrenceIndex()
+
+        started = time.perf_counter()
+        index.add_artists(artists)
+        counted = time.perf_counter()
+        related = index.related_genres(k=SpotifyService.RELATED_GENRES_COUNT)
+        ranked = time.perf_counter()
+
+        self.stdout.write(
+            f"full build, {artist_count} artists: count {1000 * (counted - started):.1f} ms, "
+            f"top-k {1000 * (ranked - counted):.1f} ms, {len(index.pair_codes)} pairs, {len(related)} genres with related lists"
+        )
+
+        started = time.perf_counter()
+        touched = index.add_artists(increment)
+        counted = time.perf_counter()
+        related = index.related_genres(k=SpotifyService.RELATED_GENRES_COUNT, only=index.neighbourhood(touched))
+        ranked = time.perf_counter()
+
+        self.stdout.write(
+            f"incremental, +{len(increment)} artists: count {1000 * (counted - started):.1f} ms, "
+            f"top-k {1000 * (ranked - counted):.1f} ms, {len(related)} related lists rewritten"
+        )
@@ -0,0 +1,77 @@
+import random
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django_redis import get_redis_connection
+from redis.exceptions import ResponseError
+
+from WebApplication.services.access_tracker import AccessTracker
+from WebApplication.services.spotify_service import SpotifyService
+
+FAMILIES = ("artists_for_genre", "artist_details")
+
+
+# Hit ratio vs. Redis memory for the adaptively cached Spotify data (see SpotifyService.ADAPTIVE_TTL_TIERS).
+    # Hits/misses/admissions are counted since the last `--reset`; memory is measured now, from a sample of keys.
+    # `python manage.py cache_stats --sample 500`
+class Command(BaseCommand):
+    help = "Show hit ratio, Redis memory and hit ratio per MB for cached genre/artist data"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sample", type=int, default=200, help="Keys per family to measure memory on")
+        parser.add_argument("--reset", action="store_true", help="Zero the hit/miss counters afterwards")
+
+    def handle(self, *args, **options):
+        tracker = AccessTracker()
+        stats = tracker.read_stats()
+        redis = get_redis_connection("default")
+
+        self.stdout.write(
+            f"{'family':<20}{'keys':>9}{'MB':>9}{'hits':>10}{'misses':>10}{'hit %':>8}{'hit %/MB':>10}{'hits/MB':>10}"
+        )
+
+        for family in FAMILIES:
+            keys = list(cache.iter_keys(f"{family}:*"))
+            megabytes = self.estimate_megabytes(redis, keys, options["sample"])
+
+            hits = stats.get(f"{family}:hits", 0)
+            misses = stats.get(f"{family}:misses", 0)
+            hit_ratio = 100 * hits / (hits + misses) if hits + misses else 0.0
+
+            per_mb = f"{hit_ratio / megabytes:>10.1f}{hits / megabytes:>10.0f}" if megabytes else f"{'-':>10}{'-':>10}"
+            self.stdout.write(
+                f"{family:<20}{len(keys):>9}{megabytes:>9.2f}{hits:>10}{misses:>10}{hit_ratio:>8.1f}{per_mb}"
+            )
+
+            admitted = ", ".join(
+                f"{tier} {stats.get(f'{family}:admitted:{tier}', 0)}"
+                for tier in [tier for tier, _, _ in SpotifyService.ADAPTIVE_TTL_TIERS] + ["untracked"]
+            )
+            self.stdout.write(f"{'':<20}admitted: {admitted}; hot entries extended {stats.get(f'{family}:extended', 0)}")
+
+        sketch_megabytes = AccessTracker.DEPTH * AccessTracker.WIDTH * 2 * 2 / 1024 / 1024
+        self.stdout.write(f"Access sketch: {sketch_megabytes:.2f} MB (two {AccessTracker.WINDOW // 3600}h windows)")
+
+        if options["reset"]:
+            tracker.reset_stats()
+            self.stdout.write(self.style.SUCCESS("Counters reset"))
+
+    def estimate_megabytes(self, redis, keys, sample_size):
+        if not keys:
+            return 0.0
+
+        sample = random.sample(keys, min(sample_size, len(keys)))
+        pipeline = redis.pipeline(transaction=False)
+        for key in sample:
+            pipeline.execute_command("MEMORY", "USAGE", cache.make_key(key))
+
+        try:
+            sizes = pipeline.execute()
+        except ResponseError:
+            # No MEMORY command (older or Redis-compatible servers) - value size plus key length
+            for key in sample:
+                pipeline.strlen(cache.make_key(key))
+            sizes = [size + len(key) for size, key in zip(pipeline.execute(), sample)]
+
+        sizes = [size or 0 for size in sizes]
+        return sum(sizes) / len(sample) * len(keys) / 1024 / 1024
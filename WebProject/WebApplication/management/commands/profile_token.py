@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from WebApplication.profiling import make_profile_token
+
+
+# Mint a token that turns on RequestProfilerMiddleware for the requests carrying it.
+    # `python manage.py profile_token admin`, then: curl -H "X-Profile: <token>" -H "X-Profile-Mode: sample" https://.../home/
+class Command(BaseCommand):
+    help = "Issue a request-profiling token for a staff user"
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options["username"])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user named '{options['username']}'")
+
+        if not user.is_staff:
+            raise CommandError(f"'{user.username}' is not staff")
+
+        hours = settings.REQUEST_PROFILER_TOKEN_MAX_AGE / 3600
+        self.stdout.write(make_profile_token(user.username))
+        self.stderr.write(
+            f"Valid for {hours:g}h. Send it as the X-Profile header (or ?__profile=<token>); "
+            f"X-Profile-Mode / __profile_mode picks 'cprofile' (default, .prof) or 'sample' (.collapsed). "
+            f"Profiles are written to {settings.REQUEST_PROFILER_DIR}"
+        )
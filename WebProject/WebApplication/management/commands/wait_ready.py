@@ -0,0 +1,39 @@
+import time
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Poll the /ready/ endpoint until the app server has finished warming up.
+    # Used by deploy.sh (before nginx is restarted) and by the production container healthcheck.
+class Command(BaseCommand):
+    help = "Wait until /ready/ reports that warm-up has finished"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000/ready/")
+        parser.add_argument("--timeout", type=float, default=120, help="Seconds to wait before giving up")
+        parser.add_argument("--interval", type=float, default=1)
+
+    def handle(self, *args, **options):
+        # Django validates the Host header, so present ourselves as the configured domain
+        host = settings.ALLOWED_HOSTS[0].lstrip(".") if settings.ALLOWED_HOSTS else "localhost"
+        if host == "*":
+            host = "localhost"
+
+        request = urllib.request.Request(options["url"], headers={"Host": host})
+        deadline = time.monotonic() + options["timeout"]
+
+        while True:
+            try:
+                with urllib.request.urlopen(request, timeout=options["interval"] + 1):
+                    self.stdout.write(self.style.SUCCESS("App is warmed up and ready"))
+                    return
+            except (urllib.error.URLError, OSError) as e:
+                last_error = e
+
+            if time.monotonic() >= deadline:
+                raise CommandError(f"App not ready after {options['timeout']}s: {last_error}")
+
+            time.sleep(options["interval"])
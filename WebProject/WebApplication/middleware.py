@@ -0,0 +1,216 @@
+import gzip
+import logging
+import os
+import re
+import time
+
+import brotli
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.text import compress_string
+
+from .profiling import PROFILERS, check_profile_token, is_staff_user, profile_filename
+from .request_cache import RequestCache, activate, deactivate
+
+logger = logging.getLogger(__name__)
+
+
+# Blocks whose whitespace is significant (or not HTML at all) - never minified.
+PRESERVED_BLOCK_RE = re.compile(
+    r"(<(pre|textarea|script|style)\b.*?</\2\s*>)", re.IGNORECASE | re.DOTALL
+)
+HTML_COMMENT_RE = re.compile(r"<!--(?!\[if).*?-->", re.DOTALL)
+BETWEEN_TAGS_RE = re.compile(r">\s+<")
+WHITESPACE_RE = re.compile(r"\s{2,}|[\t\r\n]")
+
+ACCEPT_ENCODING_RE = re.compile(r"\s*([^\s;,]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?")
+
+
+def minify_html(html):
+    """
+    Conservative HTML minifier: drops comments and collapses whitespace outside
+    <pre>, <textarea>, <script> and <style>.
+    """
+    parts = PRESERVED_BLOCK_RE.split(html)
+    output = []
+
+    # re.split with two groups yields: text, whole block, tag name, text, ...
+    for index in range(0, len(parts), 3):
+        text = HTML_COMMENT_RE.sub("", parts[index])
+        text = BETWEEN_TAGS_RE.sub("> <", text)
+        text = WHITESPACE_RE.sub(" ", text)
+        output.append(text)
+
+        if index + 1 < len(parts):
+            output.append(parts[index + 1])
+
+    return "".join(output).strip()
+
+
+def accepted_encodings(accept_encoding):
+    """
+    Parse an Accept-Encoding header into the set of codings with q > 0.
+    """
+    accepted = set()
+
+    for match in ACCEPT_ENCODING_RE.finditer(accept_encoding):
+        coding, quality = match.group(1).lower(), match.group(2)
+        try:
+            if quality is not None and float(quality) <= 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding)
+
+    return accepted
+
+
+# Minifies rendered HTML and compresses it with brotli or gzip, depending on what the client accepts.
+    # Responses that carry the CSRF token only ever get gzip with random-length padding (as Django's GZipMiddleware does),
+    # so the compressed length can't be used to guess the token byte-by-byte (BREACH).
+class CompressionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+        self.min_size = settings.RESPONSE_COMPRESSION_MIN_SIZE
+        self.brotli_quality = settings.RESPONSE_COMPRESSION_BROTLI_QUALITY
+        self.gzip_level = settings.RESPONSE_COMPRESSION_GZIP_LEVEL
+        self.breach_max_random_bytes = settings.RESPONSE_COMPRESSION_BREACH_MAX_RANDOM_BYTES
+        self.minify = settings.RESPONSE_MINIFY_HTML
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_response(self, request, response):
+        if response.streaming or response.has_header("Content-Encoding"):
+            return response
+
+        content_type = response.get("Content-Type", "")
+
+        if self.minify and content_type.startswith("text/html") and response.status_code == 200:
+            charset = response.charset
+            response.content = minify_html(response.content.decode(charset)).encode(charset)
+            response.headers["Content-Length"] = str(len(response.content))
+
+        # Too small to be worth it - compression can even make these bigger
+        if len(response.content) < self.min_size:
+            return response
+
+        # From here on the body depends on Accept-Encoding
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+        encodings = accepted_encodings(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        carries_csrf_token = (
+            b"csrfmiddlewaretoken" in response.content
+            or settings.CSRF_COOKIE_NAME in response.cookies
+        )
+
+        if "br" in encodings and not carries_csrf_token:
+            compressed = brotli.compress(response.content, quality=self.brotli_quality, mode=brotli.MODE_TEXT)
+            encoding = "br"
+        elif "gzip" in encodings:
+            if carries_csrf_token:
+                compressed = compress_string(response.content, max_random_bytes=self.breach_max_random_bytes)
+            else:
+                compressed = gzip.compress(response.content, compresslevel=self.gzip_level, mtime=0)
+            encoding = "gzip"
+        else:
+            return response
+
+        if len(compressed) >= len(response.content):
+            return response
+
+        logger.debug(f"Compressed {request.path} with {encoding}: {len(response.content)} -> {len(compressed)} bytes")
+
+        response.content = compressed
+        response.headers["Content-Length"] = str(len(compressed))
+        response.headers["Content-Encoding"] = encoding
+
+        # The encoded body is a different representation, so a strong ETag no longer matches it
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+
+        return response
+
+
+# Profiles a single request on demand - enabled by a staff token (see `manage.py profile_token`) in the
+    # X-Profile header or the __profile query parameter. It sits first in MIDDLEWARE, so the profile covers
+    # session access, compression and everything below. Without the flag the cost is a header lookup and a substring test.
+class RequestProfilerMiddleware:
+    HEADER = "HTTP_X_PROFILE"
+    MODE_HEADER = "HTTP_X_PROFILE_MODE"
+    QUERY_PARAM = "__profile"
+    MODE_QUERY_PARAM = "__profile_mode"
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+        self.output_dir = settings.REQUEST_PROFILER_DIR
+        self.token_max_age = settings.REQUEST_PROFILER_TOKEN_MAX_AGE
+        self.sample_interval = settings.REQUEST_PROFILER_SAMPLE_INTERVAL
+
+    def __call__(self, request):
+        token = request.META.get(self.HEADER)
+        if token is None and self.QUERY_PARAM in request.META.get("QUERY_STRING", ""):
+            token = request.GET.get(self.QUERY_PARAM)
+        if not token:
+            return self.get_response(request)
+
+        staff = check_profile_token(token, self.token_max_age)
+        mode = request.META.get(self.MODE_HEADER) or request.GET.get(self.MODE_QUERY_PARAM, "cprofile")
+        if staff is None or mode not in PROFILERS or not is_staff_user(staff):
+            logger.warning(f"Ignoring profiling request for {request.path} - invalid or expired token, not staff, or unknown mode")
+            return self.get_response(request)
+
+        return self.profile(request, staff, PROFILERS[mode](self.sample_interval))
+
+    def profile(self, request, staff, profiler):
+        started = time.perf_counter()
+        try:
+            profiler.start()
+        except ValueError:
+            # Another cProfile is already active in this process
+            logger.warning("Profiler already running - serving the request unprofiled")
+            return self.get_response(request)
+
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.stop()
+        elapsed = time.perf_counter() - started
+
+        route = request.resolver_match.route if request.resolver_match else request.path
+        filename = profile_filename(request.method, route, elapsed, profiler.extension)
+
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            profiler.save(os.path.join(self.output_dir, filename))
+        except OSError:
+            logger.exception(f"Could not save profile {filename}")
+            return response
+
+        logger.info(f"Profiled {request.method} {request.path} for '{staff}' in {elapsed * 1000:.0f} ms -> {filename}")
+        response.headers["X-Profile-File"] = filename
+        # Not to be shared by nginx / a CDN with anyone else
+        patch_cache_control(response, private=True, no_store=True)
+        return response
+
+
+# Gives each request its own RequestCache (see request_cache): cache reads are memoised for the request and
+    # writes - cache entries, expiry extensions, access-stats counters - go to Redis in one pipeline at the end,
+    # before the response is returned, so the next request sees them.
+class RequestCacheMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_cache = RequestCache(cache)
+        token = activate(request_cache)
+        try:
+            return self.get_response(request)
+        finally:
+            deactivate(token)
+            request_cache.flush()
@@ -0,0 +1,103 @@
+import cProfile
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.core import signing
+
+# Signed tokens enabling the profiler - minted for staff users by `python manage.py profile_token`
+PROFILE_TOKEN_SALT = "WebApplication.profiling"
+
+
+def make_profile_token(username):
+    return signing.dumps({"staff": username}, salt=PROFILE_TOKEN_SALT)
+
+
+def check_profile_token(token, max_age):
+    """
+    Return the staff username the token was issued to, or None if it is invalid or expired.
+    """
+    try:
+        return signing.loads(token, salt=PROFILE_TOKEN_SALT, max_age=max_age)["staff"]
+    except (signing.BadSignature, KeyError, TypeError):
+        return None
+
+
+# Tokens are good for a day - checked again on every use, so taking away staff status revokes them
+def is_staff_user(username):
+    return get_user_model().objects.filter(username=username, is_staff=True, is_active=True).exists()
+
+
+# Deterministic profile (cProfile) - every call is counted, saved as a .prof (pstats) file.
+    # Open it with `python -m pstats`, snakeviz, or turn it into a flame graph with flameprof.
+class DeterministicProfiler:
+    extension = "prof"
+
+    def __init__(self, interval=None):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def save(self, path):
+        self.profile.dump_stats(path)
+
+
+# Sampling profiler - a background thread records the request thread's stack every `interval` seconds.
+    # Much lower overhead than cProfile and wall-clock based, so time blocked on Spotify / Redis shows up too.
+    # Saved as collapsed stacks ("frame;frame;frame count" per line), the input format of flamegraph.pl and speedscope.
+class SamplingProfiler:
+    extension = "collapsed"
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.samples = Counter()
+        self.thread_id = threading.get_ident()
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self.run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self.sampler.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.sampler.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+    def save(self, path):
+        with open(path, "w") as collapsed:
+            for stack, count in self.samples.most_common():
+                collapsed.write(f"{stack} {count}\n")
+
+
+PROFILERS = {
+    "cprofile": DeterministicProfiler,
+    "sample": SamplingProfiler,
+}
+
+
+# <time>_<METHOD>_<route>_<ms>ms_<random>.<ext>, e.g. 20261019-142501_GET_artist-str-id_845ms_3f9a1c2e.collapsed -
+    # the random part keeps two profiles of one route within the same second apart
+def profile_filename(method, route, elapsed, extension):
+    route = re.sub(r"[^A-Za-z0-9]+", "-", route).strip("-") or "root"
+    return f"{time.strftime('%Y%m%d-%H%M%S')}_{method}_{route}_{elapsed * 1000:.0f}ms_{uuid.uuid4().hex[:8]}.{extension}"
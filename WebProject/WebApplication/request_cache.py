@@ -0,0 +1,171 @@
+import logging
+import threading
+from contextvars import ContextVar
+
+from django.core.cache import cache as django_cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# The RequestCache of the request being handled (None outside requests - Celery, warm-up, management commands)
+_current = ContextVar("request_cache", default=None)
+
+MISSING = object()
+
+
+# Request-scoped facade over the default (django_redis) cache.
+    # Reads are memoised for the rest of the request - misses included - and `prefetch()` turns a set of
+    # independent reads into one MGET. Writes (set / set_many / touch / delete / deferred raw commands) land in the
+    # memo at once but reach Redis in one pipeline when the request ends (RequestCacheMiddleware).
+    # `add()` stays synchronous - it's used as a lock / debounce and its answer matters now.
+    # Values are shared within the request, so callers must not mutate what they read.
+class RequestCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.memo = {}
+        self.writes = []        # callables taking a Redis pipeline (or None when the backend isn't Redis)
+        self.lock = threading.Lock()  # genre fetch threads share the request's cache
+
+
+    def get(self, key, default=None):
+        with self.lock:
+            known = key in self.memo
+            value = self.memo.get(key, MISSING)
+        if not known:
+            value = self.backend.get(key, MISSING)
+            with self.lock:
+                value = self.memo.setdefault(key, value)
+        return default if value is MISSING else value
+
+
+    def get_many(self, keys):
+        self.prefetch(keys)
+        with self.lock:
+            return {key: self.memo[key] for key in keys if self.memo.get(key, MISSING) is not MISSING}
+
+
+    def prefetch(self, keys):
+        """
+        Read every key not seen yet in this request with a single MGET.
+        """
+        with self.lock:
+            missing = [key for key in dict.fromkeys(keys) if key not in self.memo]
+        if not missing:
+            return
+
+        found = self.backend.get_many(missing)
+        with self.lock:
+            for key in missing:
+                self.memo.setdefault(key, found.get(key, MISSING))
+
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        with self.lock:
+            self.memo[key] = value
+            self.writes.append(lambda pipeline: self.backend.set(key, value, timeout, **self.pipeline_kwargs(pipeline)))
+
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT):
+        data = dict(data)
+        with self.lock:
+            self.memo.update(data)
+            self.writes.append(lambda pipeline: self.write_many(data, timeout, pipeline))
+        return []
+
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT):
+        with self.lock:
+            self.writes.append(lambda pipeline: self.backend.touch(key, timeout, **self.pipeline_kwargs(pipeline)))
+        return True
+
+
+    def delete(self, key):
+        with self.lock:
+            self.memo[key] = MISSING
+            self.writes.append(lambda pipeline: self.backend.delete(key, **self.pipeline_kwargs(pipeline)))
+
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT):
+        added = self.backend.add(key, value, timeout)
+        if added:
+            with self.lock:
+                self.memo[key] = value
+        return added
+
+
+    def defer(self, callback):
+        """
+        Queue raw Redis commands - `callback(pipeline)` adds them to the end-of-request pipeline.
+        """
+        with self.lock:
+            self.writes.append(lambda pipeline: pipeline is not None and callback(pipeline))
+
+
+    def flush(self):
+        with self.lock:
+            writes, self.writes = self.writes, []
+        if not writes:
+            return
+
+        pipeline = self.pipeline()
+        try:
+            for write in writes:
+                write(pipeline)
+            if pipeline is not None:
+                pipeline.execute()
+        except Exception:
+            logger.exception(f"Could not flush {len(writes)} request cache writes")
+
+
+    def pipeline(self):
+        client = getattr(self.backend, "client", None)
+        if not hasattr(client, "get_client"):
+            return None  # not django_redis (e.g. local-memory cache in development) - write one by one
+        return client.get_client(write=True).pipeline(transaction=False)
+
+
+    def write_many(self, data, timeout, pipeline):
+        # django_redis' set_many opens a pipeline of its own - add to ours instead
+        if pipeline is None:
+            self.backend.set_many(data, timeout)
+            return
+        for key, value in data.items():
+            self.backend.set(key, value, timeout, client=pipeline)
+
+
+    def pipeline_kwargs(self, pipeline):
+        return {} if pipeline is None else {"client": pipeline}
+
+
+    def __getattr__(self, name):
+        # Everything else (iter_keys, ttl, make_key, ...) goes straight to the backend
+        return getattr(self.backend, name)
+
+
+# Module-level stand-in for `django.core.cache.cache`: the current request's RequestCache inside a request,
+    # the plain cache everywhere else. `prefetch()` / `defer()` work in both.
+class CacheProxy:
+    def __getattr__(self, name):
+        return getattr(_current.get() or django_cache, name)
+
+    def prefetch(self, keys):
+        request_cache = _current.get()
+        if request_cache is not None:
+            request_cache.prefetch(keys)
+
+    def defer(self, callback):
+        request_cache = _current.get() or RequestCache(django_cache)
+        request_cache.defer(callback)
+        if request_cache is not _current.get():
+            request_cache.flush()
+
+
+cache = CacheProxy()
+
+
+def activate(request_cache):
+    return _current.set(request_cache)
+
+
+def deactivate(token):
+    _current.reset(token)
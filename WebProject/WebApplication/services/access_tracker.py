@@ -0,0 +1,147 @@
+import hashlib
+import logging
+import time
+
+from django_redis import get_redis_connection
+
+from ..request_cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+# How often cache keys are read, approximately - a count-min sketch in Redis.
+    # The sketch is DEPTH rows of WIDTH saturating 16-bit counters packed into one Redis string (BITFIELD),
+    # so recording a batch of keys and reading back their counts is a single command, and memory is fixed
+    # (DEPTH * WIDTH * 2 bytes per window) however many keys there are. Counts are per WINDOW; the previous window
+    # counts half, so a key that went quiet cools down within two windows.
+    # Hit/miss/admission counters for `manage.py cache_stats` ride along in the same pipeline.
+class AccessTracker:
+    DEPTH = 4
+    WIDTH = 1 << 15             # 4 x 32768 x 2 bytes = 256 KB per window
+    WINDOW = 60 * 60 * 6        # seconds
+
+    SKETCH_KEY = "access_sketch:{window}"
+    STATS_KEY = "access_stats"
+
+    def __init__(self, using="default"):
+        self.using = using
+
+
+    def positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=4 * self.DEPTH).digest()
+        return [
+            row * self.WIDTH + int.from_bytes(digest[4 * row:4 * row + 4], "little") % self.WIDTH
+            for row in range(self.DEPTH)
+        ]
+
+
+    def record(self, keys, stats=None):
+        """
+        Count one read of each key and return {key: estimated reads}. Optional `stats` ({field: increment})
+        are added to the stats hash in the same round trip. Returns {} if Redis can't be reached.
+        """
+        if not keys:
+            return {}
+
+        window = int(time.time() // self.WINDOW)
+
+        try:
+            pipeline = get_redis_connection(self.using).pipeline(transaction=False)
+            self.add_increments(pipeline, keys, window)
+            pipeline.execute_command("BITFIELD", self.SKETCH_KEY.format(window=window - 1), *self.counter_reads(keys))
+            self.add_stats(pipeline, stats or {})
+            current, _, previous = pipeline.execute()[:3]
+        except Exception as e:
+            logger.warning(f"Access tracking unavailable: {str(e)}")
+            return {}
+
+        return self.estimates(keys, current, previous)
+
+
+    def estimate(self, keys):
+        """
+        Return {key: estimated reads} without counting a read - {} if Redis can't be reached.
+        """
+        if not keys:
+            return {}
+
+        window = int(time.time() // self.WINDOW)
+        reads = self.counter_reads(keys)
+
+        try:
+            pipeline = get_redis_connection(self.using).pipeline(transaction=False)
+            pipeline.execute_command("BITFIELD", self.SKETCH_KEY.format(window=window), *reads)
+            pipeline.execute_command("BITFIELD", self.SKETCH_KEY.format(window=window - 1), *reads)
+            current, previous = pipeline.execute()
+        except Exception as e:
+            logger.warning(f"Access tracking unavailable: {str(e)}")
+            return {}
+
+        return self.estimates(keys, current, previous)
+
+
+# Count reads (and stats) nobody waits on - e.g. cache hits. Inside a request they ride along with its
+    # end-of-request writes (see request_cache), so the read path doesn't pay a round trip; elsewhere they're sent right away.
+    def count(self, keys=(), stats=None):
+        window = int(time.time() // self.WINDOW)
+
+        def queue(pipeline):
+            if keys:
+                self.add_increments(pipeline, keys, window)
+            self.add_stats(pipeline, stats or {})
+
+        if self.using == "default":
+            cache.defer(queue)
+            return
+
+        try:
+            pipeline = get_redis_connection(self.using).pipeline(transaction=False)
+            queue(pipeline)
+            pipeline.execute()
+        except Exception as e:
+            logger.warning(f"Access stats unavailable: {str(e)}")
+
+
+    def count_stats(self, stats):
+        self.count(stats=stats)
+
+
+    def add_increments(self, pipeline, keys, window):
+        increments = ["OVERFLOW", "SAT"]
+        for key in keys:
+            for position in self.positions(key):
+                increments += ["INCRBY", "u16", f"#{position}", 1]
+
+        pipeline.execute_command("BITFIELD", self.SKETCH_KEY.format(window=window), *increments)
+        pipeline.expire(self.SKETCH_KEY.format(window=window), self.WINDOW * 2)
+
+
+    def counter_reads(self, keys):
+        reads = []
+        for key in keys:
+            for position in self.positions(key):
+                reads += ["GET", "u16", f"#{position}"]
+        return reads
+
+
+    # A key's count is its smallest counter (the least inflated by collisions) - the previous window's counts half
+    def estimates(self, keys, current, previous):
+        return {
+            key: min(current[self.DEPTH * index:self.DEPTH * (index + 1)])
+            + min(previous[self.DEPTH * index:self.DEPTH * (index + 1)]) // 2
+            for index, key in enumerate(keys)
+        }
+
+
+    def add_stats(self, pipeline, stats):
+        for field, increment in stats.items():
+            pipeline.hincrby(self.STATS_KEY, field, increment)
+
+
+    def read_stats(self):
+        stats = get_redis_connection(self.using).hgetall(self.STATS_KEY)
+        return {field.decode(): int(value) for field, value in stats.items()}
+
+
+    def reset_stats(self):
+        get_redis_connection(self.using).delete(self.STATS_KEY)
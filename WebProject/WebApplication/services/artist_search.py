@@ -0,0 +1,179 @@
+import bisect
+import heapq
+import logging
+import re
+import threading
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+
+# Lower-case, accent-free, punctuation-free form of a name or query - "Beyoncé" and "beyonce" match,
+    # as do "AC/DC" and "ac dc".
+def normalize_search_text(text):
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(char for char in text if not unicodedata.combining(char)).casefold()
+    return " ".join(re.sub(r"[\W_]+", " ", text).split())
+
+
+# In-process prefix index over artist names for type-ahead search.
+    # One sorted array of search keys (every word of a name starts a key, so "beat" finds "The Beatles")
+    # with a parallel array of artist ids - a prefix query is two bisects plus a top-k by popularity over the slice.
+    # Changed artists are buffered and merged on the next search: a few are insorted in place, a big batch
+    # (warm-up, rescans) re-sorts everything once. Artists can arrive from the genre fetch threads, hence the lock.
+class ArtistPrefixIndex:
+    # Only the first words of a name are indexed - enough for "the", "lil", "dj" prefixes, keeps long names cheap
+    MAX_WORDS_PER_NAME = 4
+
+    # Above this many changed artists a full re-sort beats inserting their keys one by one
+    INSORT_LIMIT = 1000
+
+    # Top-k lists for short prefixes are cached and patched as artists arrive - "a", "th" match huge slices
+    SHORT_PREFIX_LENGTH = 2
+
+    def __init__(self):
+        self.artists = {}       # artist id -> {"id", "name", "popularity", "image_url"}
+        self.keys = []          # sorted search keys
+        self.ids = []           # artist id for each key (parallel to keys)
+        self.dirty = {}         # artist id -> its name at the last merge (None if new), for artists added/renamed since
+        self.short_prefix_results = {}  # prefix -> {limit: results}
+        self.lock = threading.RLock()
+
+
+    def __len__(self):
+        return len(self.artists)
+
+
+    def add_artists(self, artists):
+        """
+        Add or update formatted artist records ({"spotify_id", "name", "popularity", ...}).
+        Returns how many were new or changed.
+        """
+        changed = 0
+        with self.lock:
+            for artist in artists:
+                artist_id = artist.get("spotify_id")
+                name = artist.get("name")
+                if not artist_id or not name:
+                    continue
+
+                entry = {
+                    "id": artist_id,
+                    "name": name,
+                    "popularity": artist.get("popularity") or 0,
+                    "image_url": artist.get("image_url"),
+                }
+                previous = self.artists.get(artist_id)
+                if previous == entry:
+                    continue
+
+                self.artists[artist_id] = entry
+                changed += 1
+
+                if previous is None or previous["name"] != name:
+                    self.dirty.setdefault(artist_id, previous and previous["name"])
+
+                if self.short_prefix_results:
+                    keys = self.name_keys(name)
+                    old_keys = self.name_keys(previous["name"]) if previous else keys
+                    self.update_short_prefixes(entry, previous, keys, old_keys)
+
+        return changed
+
+
+    def name_keys(self, name):
+        words = normalize_search_text(name).split()[:self.MAX_WORDS_PER_NAME]
+        # Each key runs to the end of the name, so multi-word queries ("the beat") keep working
+        return {" ".join(words[position:]) for position in range(len(words))}
+
+
+    def short_prefixes(self, keys):
+        return {key[:length] for key in keys for length in range(1, self.SHORT_PREFIX_LENGTH + 1)}
+
+
+# Patch the cached short-prefix top-k lists for one new or changed artist instead of recomputing them.
+    # A listed artist that dropped in popularity (or left the prefix) may make room for an unknown one,
+    # so only that case throws the list away.
+    def update_short_prefixes(self, entry, previous, keys, old_keys):
+        prefixes = self.short_prefixes(keys)
+
+        for prefix in prefixes | self.short_prefixes(old_keys):
+            by_limit = self.short_prefix_results.get(prefix)
+            if not by_limit:
+                continue
+
+            for limit, results in list(by_limit.items()):
+                listed = previous is not None and any(artist["id"] == entry["id"] for artist in results)
+
+                if listed and (prefix not in prefixes or entry["popularity"] < previous["popularity"]):
+                    del by_limit[limit]
+                elif listed or (
+                    prefix in prefixes
+                    and (len(results) < limit or entry["popularity"] > results[-1]["popularity"])
+                ):
+                    results = [artist for artist in results if artist["id"] != entry["id"]] + [entry]
+                    by_limit[limit] = heapq.nlargest(limit, results, key=lambda artist: artist["popularity"])
+
+
+    def merge_pending(self):
+        with self.lock:
+            if not self.dirty:
+                return
+
+            added, removed = [], []
+            for artist_id, merged_name in self.dirty.items():
+                keys = self.name_keys(self.artists[artist_id]["name"])
+                merged_keys = self.name_keys(merged_name) if merged_name else set()
+                added.extend((key, artist_id) for key in keys - merged_keys)
+                removed.extend((key, artist_id) for key in merged_keys - keys)
+
+            if len(self.dirty) > self.INSORT_LIMIT:
+                removed = set(removed)
+                entries = sorted([*(entry for entry in zip(self.keys, self.ids) if entry not in removed), *added])
+                self.keys = [key for key, _ in entries]
+                self.ids = [artist_id for _, artist_id in entries]
+            else:
+                for key, artist_id in removed:
+                    position = bisect.bisect_left(self.keys, key)
+                    while position < len(self.keys) and self.keys[position] == key:
+                        if self.ids[position] == artist_id:
+                            del self.keys[position]
+                            del self.ids[position]
+                            break
+                        position += 1
+
+                for key, artist_id in added:
+                    position = bisect.bisect_right(self.keys, key)
+                    self.keys.insert(position, key)
+                    self.ids.insert(position, artist_id)
+
+            self.dirty = {}
+
+
+    def search(self, query, limit=10):
+        """
+        Return up to `limit` artist entries whose name has a word starting with `query`, most popular first.
+        """
+        prefix = normalize_search_text(query)
+        if not prefix:
+            return []
+
+        with self.lock:
+            self.merge_pending()
+
+            short = len(prefix) <= self.SHORT_PREFIX_LENGTH
+            if short and limit in self.short_prefix_results.get(prefix, {}):
+                return self.short_prefix_results[prefix][limit]
+
+            start = bisect.bisect_left(self.keys, prefix)
+            end = bisect.bisect_left(self.keys, prefix + "\uffff", start)  # every key starting with prefix sorts below this
+
+            # The same artist can match on several words - keep it once
+            artist_ids = set(self.ids[start:end])
+            results = heapq.nlargest(
+                limit, (self.artists[artist_id] for artist_id in artist_ids), key=lambda artist: artist["popularity"]
+            )
+
+            if short:
+                self.short_prefix_results.setdefault(prefix, {})[limit] = results
+            return results
@@ -0,0 +1,141 @@
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+# Genre co-occurrence index - "artists tagged X are often also tagged Y".
+    # Built from every artist's `genres` list we've seen. Pair counts are kept as two flat numpy arrays
+    # (pair code -> count), i.e. a sparse symmetric matrix, so both full builds and incremental merges are vectorised.
+    # Related genres are ranked by Ochiai / cosine similarity: count(X, Y) / sqrt(count(X) * count(Y)).
+class GenreCooccurrenceIndex:
+    # A pair of genre ids (i < j) is packed into one int64: i << 32 | j
+    PAIR_SHIFT = np.int64(32)
+    PAIR_MASK = np.int64(0xFFFFFFFF)
+
+    # Pairs seen only once are mostly tagging noise
+    MIN_PAIR_COUNT = 2
+
+    def __init__(self):
+        self.genres = []                # genre id -> genre name
+        self.genre_ids = {}             # genre name -> genre id
+        self.genre_counts = np.zeros(0, dtype=np.int64)
+        self.pair_codes = np.zeros(0, dtype=np.int64)   # sorted, unique
+        self.pair_counts = np.zeros(0, dtype=np.int64)
+        self.artist_ids = set()
+
+
+    def add_artists(self, artist_genres):
+        """
+        Merge {artist_id: [genre, ...]} into the index, skipping artists already counted.
+        Returns the set of genre names whose related list may have changed.
+        """
+        genre_id_rows = []
+        for artist_id, genres in artist_genres.items():
+            if artist_id in self.artist_ids:
+                continue
+            self.artist_ids.add(artist_id)
+
+            ids = sorted({self.genre_id(genre) for genre in genres if genre})
+            if ids:
+                genre_id_rows.append(ids)
+
+        if not genre_id_rows:
+            return set()
+
+        # Genre frequencies
+        flat_ids = np.fromiter((i for ids in genre_id_rows for i in ids), dtype=np.int64)
+        self.genre_counts = np.pad(self.genre_counts, (0, len(self.genres) - len(self.genre_counts)))
+        np.add.at(self.genre_counts, flat_ids, 1)
+
+        # Pair codes for every (i < j) within each artist, counted with one np.unique
+        new_codes = np.fromiter(
+            (
+                (ids[a] << 32) | ids[b]
+                for ids in genre_id_rows
+                for a in range(len(ids))
+                for b in range(a + 1, len(ids))
+            ),
+            dtype=np.int64,
+        )
+        self.merge_pair_codes(new_codes)
+
+        return {self.genres[i] for i in np.unique(flat_ids)}
+
+
+    def merge_pair_codes(self, new_codes):
+        if not len(new_codes):
+            return
+
+        codes = np.concatenate([self.pair_codes, new_codes])
+        counts = np.concatenate([self.pair_counts, np.ones(len(new_codes), dtype=np.int64)])
+
+        self.pair_codes, inverse = np.unique(codes, return_inverse=True)
+        self.pair_counts = np.bincount(inverse, weights=counts).astype(np.int64)
+
+
+    def genre_id(self, genre):
+        genre_id = self.genre_ids.get(genre)
+        if genre_id is None:
+            genre_id = len(self.genres)
+            self.genre_ids[genre] = genre_id
+            self.genres.append(genre)
+        return genre_id
+
+
+    def neighbourhood(self, genres):
+        """
+        The given genre names plus every genre that co-occurs with them - the rows whose
+        ranking can change when these genres' counts change.
+        """
+        ids = np.array([self.genre_ids[genre] for genre in genres if genre in self.genre_ids], dtype=np.int64)
+
+        first = self.pair_codes >> self.PAIR_SHIFT
+        second = self.pair_codes & self.PAIR_MASK
+        touching = np.isin(first, ids) | np.isin(second, ids)
+
+        neighbour_ids = np.union1d(ids, np.union1d(first[touching], second[touching]))
+        return {self.genres[i] for i in neighbour_ids.tolist()}
+
+
+    def related_genres(self, k=8, only=None):
+        """
+        Return {genre: [top-k related genres]} for every genre (or only the given genre names).
+        """
+        keep = self.pair_counts >= self.MIN_PAIR_COUNT
+        codes, counts = self.pair_codes[keep], self.pair_counts[keep]
+
+        first = codes >> self.PAIR_SHIFT
+        second = codes & self.PAIR_MASK
+        scores = counts / np.sqrt(self.genre_counts[first] * self.genre_counts[second])
+
+        # The matrix is symmetric - emit every pair in both directions
+        rows = np.concatenate([first, second])
+        cols = np.concatenate([second, first])
+        scores = np.concatenate([scores, scores])
+
+        if only is not None:
+            wanted = np.array([self.genre_ids[genre] for genre in only if genre in self.genre_ids], dtype=np.int64)
+            selected = np.isin(rows, wanted)
+            rows, cols, scores = rows[selected], cols[selected], scores[selected]
+
+        # Sort by row, then by score descending, and keep the first k entries of every row
+        order = np.lexsort((-scores, rows))
+        rows, cols = rows[order], cols[order]
+
+        row_starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+        row_lengths = np.diff(np.r_[row_starts, len(rows)])
+        rank_in_row = np.arange(len(rows)) - np.repeat(row_starts, row_lengths)
+
+        top = rank_in_row < k
+        related = {}
+        for row, col in zip(rows[top].tolist(), cols[top].tolist()):
+            related.setdefault(self.genres[row], []).append(self.genres[col])
+
+        if only is not None:
+            # Genres whose pairs all fell under MIN_PAIR_COUNT still get an (empty) entry
+            for genre in only:
+                related.setdefault(genre, [])
+
+        return related
@@ -1,6 +1,24 @@
+import hashlib
+import json
 import logging
-from django.core.cache import cache
+import random
+import re
+import string
+import threading
+import time
+import unicodedata
+from collections import Counter
+from contextvars import copy_context
+from itertools import zip_longest
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django_redis import get_redis_connection
 from ..clients.spotify import SpotifyAPIClient, SpotifyAPIError
+from .genre_index import GenreCooccurrenceIndex
+from .artist_search import ArtistPrefixIndex, normalize_search_text
+from .access_tracker import AccessTracker
+from ..deadline import DeadlineExceeded
+from ..request_cache import cache
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +34,10 @@ class SpotifyRequestError(SpotifyServiceError):
     """Raised when there is an error in the Spotify API request."""
 
 
+class InvalidGenre(SpotifyServiceError):
+    """Raised when a genre name is empty, too long or contains characters no genre uses."""
+
+
 class SpotifyService:
 # Baked-in genre seeds for non-authenticated users
     GENRE_SEEDS = [
@@ -24,9 +46,204 @@ class SpotifyService:
         "blues"
     ]
 
+    # How long artist data stays cached
+    ARTIST_CACHE_TIMEOUT = 60 * 60  # 1 hour
+
+    # Adaptive TTLs for `artists_for_genre:*` and `artist_details:*` - (tier, min. reads, timeout), first match wins.
+    # Reads are counted by the AccessTracker sketch over the last 6-12 hours. Hot entries are re-extended
+    # about every HOT reads (sampled), so seed genres effectively never expire; one-off lookups are admitted only briefly.
+    ADAPTIVE_TTL_TIERS = (
+        ("hot", 20, 60 * 60 * 6),               # 6 hours
+        ("warm", 3, ARTIST_CACHE_TIMEOUT),      # 1 hour
+        ("cold", 2, 60 * 15),                   # 15 minutes
+        ("once", 0, 60 * 2),                    # 2 minutes
+    )
+
+    # How long a user's profile stays cached - shorter than a user token's 1h lifetime
+    USER_CACHE_TIMEOUT = 60 * 10  # 10 minutes
+
+    # Spotify top-artist time ranges: how much each counts towards the user's top genres,
+    # and how long its top-artist list stays cached (recent listening changes faster).
+    TIME_RANGE_WEIGHTS = {
+        "short_term": 3.0,   # ~4 weeks
+        "medium_term": 2.0,  # ~6 months
+        "long_term": 1.0,    # ~1 year
+    }
+    TIME_RANGE_CACHE_TIMEOUTS = {
+        "short_term": 60 * 60,        # 1 hour
+        "medium_term": 60 * 60 * 6,   # 6 hours
+        "long_term": 60 * 60 * 24,    # 1 day
+    }
+
+    # Negative caching - genres with no artists, and genres whose search just failed upstream
+    EMPTY_GENRE_CACHE_TIMEOUT = 60 * 10  # 10 minutes
+    FAILED_GENRE_CACHE_TIMEOUT = 30  # seconds, just enough to stop a retry storm
+
+    # Longest real Spotify genre names are ~40 characters
+    GENRE_MAX_LENGTH = 50
+    GENRE_ALLOWED_RE = re.compile(r"^\w[\w &'+\-.]*$")
+
+    # Genre co-occurrence index ("related genres"), rebuilt by the update_genre_index task
+    GENRE_INDEX_STATE_KEY = "genre_index:state"
+    GENRE_INDEX_QUEUE_KEY = "genre_index:new_artists"   # raw Redis hash, filled as artists are cached
+    GENRE_INDEX_QUEUE_TIMEOUT = 60 * 60 * 24           # dropped if the task stops running
+    RELATED_GENRES_COUNT = 8
+
+    # Most genres browsable together in one request (each one is a concurrent Spotify search on a cache miss)
+    MAX_SELECTED_GENRES = 4
+    GENRE_INDEX_SCAN_BATCH = 1000
+
+    # Artist name type-ahead - served from the in-process prefix index, Spotify only for prefixes it can't fill
+    ARTIST_SEARCH_LIMIT = 10
+    ARTIST_SEARCH_MAX_LENGTH = 100              # longer queries are cut - no artist name is longer than this
+    ARTIST_SEARCH_REMOTE_MIN_LENGTH = 3         # shorter prefixes always have plenty of local matches
+    ARTIST_SEARCH_REMOTE_BELOW = 3              # "unknown" prefix - fewer local matches than this
+    ARTIST_SEARCH_REMOTE_CACHE_TIMEOUT = 60 * 60  # 1 hour
+    ARTIST_SEARCH_DEBOUNCE = 1                  # seconds between Spotify searches for one client
+    ARTIST_SEARCH_RESCAN_INTERVAL = 60 * 5      # pick up artists cached by other processes (background thread)
+
     def __init__(self):
         logger.info("SpotifyService initialized")
         self.client = SpotifyAPIClient()
+        self.artist_search_index = ArtistPrefixIndex()
+        self.access_tracker = AccessTracker()
+        self.artist_search_scanned_at = None
+        self.artist_search_refresher = None
+        self.artist_search_refresher_lock = threading.Lock()
+
+
+# Per-user cache key. We only know the user's access token before the profile is fetched,
+    # so the key is derived from a hash of it (never the raw token).
+    @staticmethod
+    def user_cache_key(prefix, access_token):
+        token_hash = hashlib.sha256(access_token.encode()).hexdigest()[:32]
+        return f"{prefix}:{token_hash}"
+
+
+# Canonical form of a genre name, used for both the Spotify query and the cache key.
+    # "  Hip_Hop ", "HIP  HOP" and "hip hop" all become "hip hop", so variants share one cache entry.
+    def normalize_genre(self, genre_name):
+        """
+        Return the canonical genre name, or raise InvalidGenre.
+        """
+        if not isinstance(genre_name, str):
+            raise InvalidGenre(f"Invalid genre name: expected a string, got {type(genre_name).__name__}")
+
+        genre = unicodedata.normalize("NFKC", genre_name).lower()
+        genre = " ".join(genre.replace("_", " ").split())
+
+        if not genre or len(genre) > self.GENRE_MAX_LENGTH or not self.GENRE_ALLOWED_RE.match(genre):
+            raise InvalidGenre(f"Invalid genre name: '{genre_name[:self.GENRE_MAX_LENGTH]}'")
+
+        return genre
+
+
+# Several `genre_name` query values at once - canonical, without duplicates, at most MAX_SELECTED_GENRES.
+    def normalize_genre_selection(self, genre_names):
+        """
+        Return the canonical genre names, or raise InvalidGenre if any of them is invalid.
+        """
+        return list(dict.fromkeys(
+            self.normalize_genre(genre_name) for genre_name in genre_names[:self.MAX_SELECTED_GENRES]
+        ))
+
+
+# Shape raw Spotify artist JSON into the dict our templates use.
+    def format_artist(self, artist_data):
+        return {
+            "spotify_id": artist_data.get("id"),
+            "name": artist_data.get("name"),
+            "popularity": artist_data.get("popularity", 0),
+            "genres": artist_data.get("genres", []),
+            "followers": artist_data.get("followers", {}).get("total", 0),
+            "image_url": artist_data['images'][0]['url'] if artist_data.get('images') else None,
+            "external_url": artist_data.get("external_urls", {}).get("spotify", "")
+        }
+
+
+# Cache full artist objects we already got from another endpoint (e.g. top artists),
+    # so get_artist_details() doesn't have to fetch them again. Only artists not cached yet are written -
+    # a cached record keeps the TTL its own reads earned (a hot artist in an obscure genre stays hot).
+    # Without a `timeout` (e.g. the genre list's they came with), each artist is admitted for as long as its recent reads earn.
+    def cache_artists(self, artists_data, timeout=None):
+        artists = {
+            f"artist_details:{artist_data['id']}": self.format_artist(artist_data)
+            for artist_data in artists_data
+            if artist_data.get("id")
+        }
+        if not artists:
+            return
+
+        self.artist_search_index.add_artists(artists.values())
+        cached = cache.get_many(list(artists))
+        new_artists = {key: artist for key, artist in artists.items() if key not in cached}
+        if not new_artists:
+            return
+
+        if timeout is not None:
+            cache.set_many(new_artists, timeout=timeout)
+        else:
+            reads = self.access_tracker.estimate(list(new_artists))
+            by_timeout = {}
+            for key, artist in new_artists.items():
+                by_timeout.setdefault(self.adaptive_timeout("artist_details", reads.get(key)), {})[key] = artist
+            for artist_timeout, batch in by_timeout.items():
+                cache.set_many(batch, timeout=artist_timeout)
+
+        self.queue_for_genre_index(new_artists.values())
+        logger.debug(f"Cached {len(new_artists)} of {len(artists)} artists from a bulk payload")
+
+
+# Newly cached artists wait in a Redis hash ({artist id: genres}) for the next update_genre_index run -
+    # with their genres, as a cold artist_details entry is long gone by then. Sent with the request's writes.
+    def queue_for_genre_index(self, artists):
+        pending = {artist["spotify_id"]: json.dumps(artist["genres"]) for artist in artists if artist.get("genres")}
+        if not pending:
+            return
+
+        def queue(pipeline):
+            pipeline.hset(self.GENRE_INDEX_QUEUE_KEY, mapping=pending)
+            pipeline.expire(self.GENRE_INDEX_QUEUE_KEY, self.GENRE_INDEX_QUEUE_TIMEOUT)
+
+        cache.defer(queue)
+
+
+# Record reads of cache keys in the access sketch (plus hit/miss stats for `manage.py cache_stats`),
+    # and push out the expiry of hits that are hot. Only misses need their count now (it picks their TTL), so hits
+    # are counted with the request's end-of-request writes - except a 1-in-HOT sample, checked now to catch the
+    # hot ones. Returns {key: estimated reads} for the keys checked - {} if tracking is down.
+    def track_reads(self, family, keys, hits):
+        hot_tier, hot_reads, hot_timeout = self.ADAPTIVE_TTL_TIERS[0]
+        hits = set(hits)
+        sampled = {key for key in hits if random.random() < 1 / hot_reads}
+
+        self.access_tracker.count([key for key in hits if key not in sampled], stats={
+            f"{family}:hits": len(hits),
+            f"{family}:misses": len(keys) - len(hits),
+        })
+        reads = self.access_tracker.record([key for key in keys if key not in hits or key in sampled])
+
+        extended = [key for key in sampled if reads.get(key, 0) >= hot_reads]
+        for key in extended:
+            cache.touch(key, hot_timeout)
+        if extended:
+            self.access_tracker.count_stats({f"{family}:extended": len(extended)})
+
+        return reads
+
+
+# Cache timeout for an entry read `reads` times recently (None: tracking is down - the plain old timeout).
+    # `min_tier` keeps entries we know are wanted (e.g. the baked-in seed genres) from being admitted as one-offs.
+    def adaptive_timeout(self, family, reads, min_tier=None):
+        if reads is None:
+            tier, timeout = "untracked", self.ARTIST_CACHE_TIMEOUT
+        else:
+            tier, _, timeout = next(
+                tier for tier in self.ADAPTIVE_TTL_TIERS if reads >= tier[1] or tier[0] == min_tier
+            )
+
+        self.access_tracker.count_stats({f"{family}:admitted:{tier}": 1})
+        return timeout
 
 
 # NOTE: SECTION FOR FUNCTIONS RELATED TO USER AUTHENTICATION.
@@ -49,20 +266,27 @@ class SpotifyService:
 
 
 # Refresh the user's access token using their refresh token.
-    def refresh_access_token(self, refresh_token):
+    def refresh_access_token(self, refresh_token, deadline=None):
         logger.info("SpotifyService.refresh_access_token() called")
-        return self.client.refresh_access_token(refresh_token)
+        return self.client.refresh_access_token(refresh_token, deadline)
 
 
 # NOTE: SECTION FOR FUNCTIONS THAT ONLY AUTHENTICATED USERS CAN MAKE USE OF
 # Fetch user profile information.
-    def get_user_profile(self, access_token):
+    def get_user_profile(self, access_token, deadline=None):
         """
         Fetch and return Spotify user profile info.
         """
         logger.info("SpotifyService.get_user_profile() called")
+
+        cache_key = self.user_cache_key("user_profile", access_token)
+        cached = cache.get(cache_key)
+        if cached:
+            logger.debug(f"Cache hit for {cache_key}")
+            return cached
+
         try:
-            user_data = self.client.get_user_profile(access_token)
+            user_data = self.client.get_user_profile(access_token, deadline)
             profile_info = {
                 "id": user_data.get("id"),
                 "display_name": user_data.get("display_name"),
@@ -76,56 +300,126 @@ class SpotifyService:
                 "followers": user_data.get("followers", {}).get("total"),
             }
             logger.debug(f"Formatted user profile info: {profile_info}")
+            cache.set(cache_key, profile_info, timeout=self.USER_CACHE_TIMEOUT)
             return profile_info
 
         except SpotifyRequestError as e:
             logger.error(f"Error fetching user profile: {str(e)}")
             raise SpotifyServiceError("Failed to fetch user profile") from e
 
+        except DeadlineExceeded:
+            raise
+
         except Exception as e:
             logger.exception("Unexpected error in get_user_profile()")
             raise SpotifyServiceError("Unexpected error in get_user_profile") from e
 
 
 # Fetch user's top genres based on their listening history.
-    def get_user_top_genres(self, access_token, limit=20):
+    def get_user_top_genres(self, access_token, limit=20, user_id=None, deadline=None):
         """
-        Fetch user's top artists and derive most frequent genres from them.
-        This reflects what genres the user listens to most based on artist metadata.
+        Fetch user's top artists for every time range and derive their top genres - returns (top_genres, partial).
+        Genres are scored by time range (recent counts more) and artist rank (higher ranked counts more).
+        `partial` is True when a time range failed (or ran out of time) and the ranking was built without it.
         """
         logger.info("SpotifyService.get_user_top_genres() called")
-        
-        try:
-            # 1. Fetch user's top 50 artists from Spotify (based on listening history)
-            top_artists_data = self.client.get_user_top_artists(access_token, limit=50)
 
-            genres = []
+        # Per-user cache - by Spotify user id when we know it, otherwise by token
+        user_key = user_id or self.user_cache_key("token", access_token)
+        cache_keys = {
+            time_range: f"user_top_artist_genres:{user_key}:{time_range}"
+            for time_range in self.TIME_RANGE_WEIGHTS
+        }
+
+        cached = cache.get_many(list(cache_keys.values()))
+        ranked_genres = {
+            time_range: cached[cache_key]
+            for time_range, cache_key in cache_keys.items()
+            if cache_key in cached
+        }
+
+        # 1. Fetch the missing time ranges from Spotify concurrently
+        missing = [time_range for time_range in cache_keys if time_range not in ranked_genres]
+        partial = False
+        if missing:
+            logger.debug(f"Fetching top artists for {missing}")
+            fetched = self.fetch_top_artists_by_time_range(access_token, missing, deadline)
+
+            if not fetched and not ranked_genres:
+                if deadline is not None and deadline.expired():
+                    raise DeadlineExceeded("No time left to fetch user’s top genres")
+                raise SpotifyServiceError("Failed to fetch user’s top genres")
+
+            # A ranking without some time range is served as partial but not cached -
+            # the next request fetches all the missing ranges again
+            partial = len(fetched) < len(missing)
+
+            for time_range, artists in fetched.items():
+                # Those are full artist objects - keep them, the artist pages will need them
+                self.cache_artists(artists)
+
+                # Only the genre lists (in rank order) are needed for scoring
+                ranked_genres[time_range] = [artist.get("genres", []) for artist in artists]
+                if not partial:
+                    cache.set(
+                        cache_keys[time_range],
+                        ranked_genres[time_range],
+                        timeout=self.TIME_RANGE_CACHE_TIMEOUTS[time_range],
+                    )
+
+        # 2. Score every genre in one pass: time range weight x linear rank weight (rank 1 = 1.0)
+        scores = Counter()
+        for time_range, artists_genres in ranked_genres.items():
+            range_weight = self.TIME_RANGE_WEIGHTS[time_range]
+            artist_count = len(artists_genres)
+
+            for rank, genres in enumerate(artists_genres):
+                rank_weight = (artist_count - rank) / artist_count
+                for genre in genres:
+                    scores[genre] += range_weight * rank_weight
+
+        # 3. Return the top N genres, based on the provided limit
+        top_genres = [genre for genre, _ in scores.most_common(limit)]
+        logger.debug(f"User top genres: {top_genres}{' (partial)' if partial else ''}")
+        return top_genres, partial
+
+
+# Fetch the user's top 50 artists for several time ranges at once - one thread per range,
+    # so the wait is the slowest call instead of the sum. Failed (or timed out) ranges are left out of the result.
+    def fetch_top_artists_by_time_range(self, access_token, time_ranges, deadline=None):
+        results = {}
+
+        with ThreadPoolExecutor(max_workers=len(time_ranges)) as executor:
+            futures = {
+                time_range: executor.submit(
+                    self.client.get_user_top_artists, access_token, limit=50, time_range=time_range, deadline=deadline
+                )
+                for time_range in time_ranges
+            }
 
-            # 2. Collect all genre tags from those top artists
-            for artist in top_artists_data.get("items", []):
-                genres.extend(artist.get("genres", []))  # One artist can have multiple genre labels
+            for time_range, future in futures.items():
+                try:
+                    results[time_range] = future.result().get("items", [])
+                except (SpotifyAPIError, DeadlineExceeded) as e:
+                    logger.error(f"Error fetching user’s top artists ({time_range}): {str(e)}")
 
-            # 3. Count how often each genre appears across the user's top artists
-            genre_freq = {}
-            for genre in genres:
-                genre_freq[genre] = genre_freq.get(genre, 0) + 1  # Increment frequency count
+        return results
 
-            # 4. Sort genres by frequency, from most common to least
-            sorted_genres = sorted(genre_freq, key=genre_freq.get, reverse=True)
 
-            # 5. Return the top N genres, based on the provided limit
-            logger.debug(f"User top genres: {sorted_genres[:limit]}")
-            return sorted_genres[:limit]
+# NOTE: SECTION OF FUNCTIONS THAT CAN BE USED BY BOTH AUTHENTICATED AND NON-AUTHENTICATED USERS.
+# Check whether the visitor is logged in with Spotify.
+    # Without a session cookie there is no session, so we don't touch `request.session` at all - touching it
+    # adds `Vary: Cookie` and would stop nginx / a CDN from sharing public pages between visitors.
+    def is_authenticated(self, request):
+        if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+            return False
+
+        return bool(request.session.get("is_spotify_authenticated"))
 
-        except SpotifyAPIError as e:
-            logger.error(f"Error fetching user’s top genres: {str(e)}")
-            raise SpotifyServiceError("Failed to fetch user’s top genres")
-        
 
-# NOTE: SECTION OF FUNCTIONS THAT CAN BE USED BY BOTH AUTHENTICATED AND NON-AUTHENTICATED USERS.
 # Get access token, distiguishing between authenticated and non-authenticated users.
-    def get_access_token(self, request):
-        if request.session.get("is_spotify_authenticated"):
+    def get_access_token(self, request, deadline=None):
+        if self.is_authenticated(request):
             access_token = request.session.get("spotify_access_token")
             
             if not access_token:
@@ -136,7 +430,7 @@ class SpotifyService:
                     logger.error("Authenticated user missing refresh token – cannot proceed")
                     raise SpotifyRequestError("Missing refresh token for authenticated user")
                 
-                token_data = self.refresh_access_token(refresh_token)
+                token_data = self.refresh_access_token(refresh_token, deadline)
                 access_token = token_data.get("access_token")
                 request.session["spotify_access_token"] = access_token
                 request.session.modified = True
@@ -144,43 +438,359 @@ class SpotifyService:
             return access_token
         else:
             logger.info("Non-authenticated user - using default access token")
-            return self.client.get_client_access_token()
+            return self.client.get_client_access_token(deadline)
             
 
-    def get_artists_by_genre(self, genre_name, access_token):
+    def get_artists_by_genre(self, genre_name, access_token, deadline=None):
         """
         Get artist IDs for a given genre, with Redis caching.
+        Empty results and upstream failures are cached briefly too (negative caching).
         """
         logger.info(f"SpotifyService.get_artists_by_genre('{genre_name}') called")
 
-        cache_key = f"artists_for_genre:{genre_name.lower()}"
-        cached = cache.get(cache_key)
-        if cached:
+        genre_name = self.normalize_genre(genre_name)
+
+        cache_key = f"artists_for_genre:{genre_name}"
+        miss_key = f"artists_for_genre_miss:{genre_name}"
+
+        cached = cache.get_many([cache_key, miss_key])
+        reads = self.track_reads("artists_for_genre", [cache_key], [cache_key] if cached.get(cache_key) else [])
+
+        if cached.get(cache_key):
             logger.debug(f"Cache hit for {cache_key}")
-            return cached
+            return cached[cache_key]
+
+        if cached.get(miss_key) == "empty":
+            logger.debug(f"Negative cache hit for {miss_key}")
+            raise NoArtistsFound(f"No artists found for genre '{genre_name}'")
+
+        if cached.get(miss_key) == "failed":
+            logger.debug(f"Negative cache hit for {miss_key}")
+            raise SpotifyServiceError("Fetching artists by genre failed recently - not retrying yet")
 
         try:
             logger.info(f"Access token being used: {access_token}")
-            artists = self.client.search_artists_by_genre(genre_name, access_token)
-            if not artists:
-                logger.warning(f"No artists found for genre '{genre_name}'")
-                raise NoArtistsFound(f"No artists found for genre '{genre_name}'")
-
-            artist_ids = [artist['id'] for artist in artists]
-            cache.set(cache_key, artist_ids, timeout=60 * 60)  # 1 hour cache
-            logger.debug(f"Cached artist IDs for genre '{genre_name}'")
-            return artist_ids
+            artists = self.client.search_artists_by_genre(genre_name, access_token, deadline=deadline)
 
         except SpotifyAPIError as e:
             logger.error(f"Error searching artists for genre '{genre_name}': {str(e)}")
+
+            # Only cache failures that aren't specific to this caller (e.g. not an expired user token)
+            status_code = getattr(e, "status_code", None)
+            if status_code is None or status_code == 429 or status_code >= 500:
+                cache.set(miss_key, "failed", timeout=self.FAILED_GENRE_CACHE_TIMEOUT)
+
             raise SpotifyServiceError("Failed to fetch artists by genre") from e
 
+        except DeadlineExceeded:
+            # Our own budget ran out - says nothing about the genre, so no negative caching
+            raise
+
         except Exception as e:
             logger.exception("Unexpected error in get_artists_by_genre()")
             raise SpotifyServiceError("Unexpected error in get_artists_by_genre()") from e
 
+        if not artists:
+            logger.warning(f"No artists found for genre '{genre_name}'")
+            cache.set(miss_key, "empty", timeout=self.EMPTY_GENRE_CACHE_TIMEOUT)
+            raise NoArtistsFound(f"No artists found for genre '{genre_name}'")
+
+        # Search results are full artist objects, so the detail lookups that follow are cache hits -
+        # for as long as the genre list itself lives
+        timeout = self.adaptive_timeout(
+            "artists_for_genre", reads.get(cache_key), min_tier="warm" if genre_name in self.GENRE_SEEDS else None
+        )
+        self.cache_artists(artists, timeout=timeout)
+
+        artist_ids = [artist['id'] for artist in artists]
+        cache.set(cache_key, artist_ids, timeout=timeout)
+        logger.debug(f"Cached artist IDs for genre '{genre_name}'")
+        return artist_ids
+
+
+# Read the cache entries a page starts from - the genres' related genres, artist lists and negative-cache markers,
+    # artist details, optionally the client token - in one round trip. Only does anything inside a request
+    # (RequestCacheMiddleware): the reads that follow are then served from the request's cache.
+    def prefetch_page(self, genre_names=(), artist_ids=(), client_token=False):
+        keys = [key for genre_name in genre_names for key in (
+            f"related_genres:{genre_name}", f"artists_for_genre:{genre_name}", f"artists_for_genre_miss:{genre_name}"
+        )]
+        keys += [f"artist_details:{artist_id}" for artist_id in artist_ids]
+        if client_token:
+            keys += [self.client.CLIENT_TOKEN_KEY, self.client.CLIENT_TOKEN_EXPIRY_KEY]
+        cache.prefetch(keys)
+
+
+# Related genres for a selection of genres, precomputed by update_genre_index() - one cache read. Each genre's
+    # list in turn (round-robin), so every selected genre contributes, without the selected genres themselves.
+    def get_related_genres_for_selection(self, genre_names):
+        related = cache.get_many([f"related_genres:{genre_name}" for genre_name in genre_names])
+        if len(genre_names) == 1:
+            return related.get(f"related_genres:{genre_names[0]}", [])
+
+        merged = {}
+        for candidates in zip_longest(*related.values()):
+            for genre in candidates:
+                if genre and genre not in genre_names:
+                    merged.setdefault(genre, None)
+
+        return list(merged)[:self.RELATED_GENRES_COUNT]
+
+
+# Artists for one or more (normalized) genres. The genres' artist ID lists are resolved concurrently - one thread
+    # per genre, so a cold selection costs the slowest search rather than the sum - then merged with every artist once,
+    # their details loaded in one pass over the union, and ranked by popularity when several genres were merged.
+    def get_artists_for_genres(self, genre_names, access_token, deadline=None):
+        """
+        Return {"artists": [...], "missing_genres": [...], "failed_genres": [...], "partial": bool}.
+        Genres without artists are missing; genres whose fetch failed (e.g. Spotify 5xx) are failed and make
+        the result partial, as do timeouts. Raises the first genre's error when none of the genres has artists.
+        """
+        logger.info(f"SpotifyService.get_artists_for_genres({genre_names}) called")
+
+        genre_artist_ids, errors = self.fetch_artist_ids_by_genres(genre_names, access_token, deadline)
+        if not genre_artist_ids:
+            raise next(iter(errors.values()))
+
+        # Ordered union - an artist tagged with two of the genres is fetched and shown once
+        artist_ids = list(dict.fromkeys(
+            artist_id for artist_ids in genre_artist_ids.values() for artist_id in artist_ids
+        ))
+        artists = self.get_artists_details_bulk(artist_ids, access_token, deadline)
+
+        if len(genre_artist_ids) > 1:
+            artists.sort(key=lambda artist: artist.get("popularity") or 0, reverse=True)
+
+        timed_out = any(isinstance(error, DeadlineExceeded) for error in errors.values())
+        failed_genres = [
+            genre_name for genre_name, error in errors.items() if not isinstance(error, (NoArtistsFound, DeadlineExceeded))
+        ]
+        return {
+            "artists": artists,
+            "missing_genres": [genre_name for genre_name, error in errors.items() if isinstance(error, NoArtistsFound)],
+            "failed_genres": failed_genres,
+            "partial": timed_out or bool(failed_genres)
+            or (len(artists) < len(artist_ids) and deadline is not None and deadline.expired()),
+        }
+
+
+    def fetch_artist_ids_by_genres(self, genre_names, access_token, deadline=None):
+        """
+        Return ({genre: [artist IDs]}, {genre: error}), both in the order of genre_names.
+        """
+        def fetch(genre_name):
+            try:
+                return self.get_artists_by_genre(genre_name, access_token, deadline), None
+            except (SpotifyServiceError, DeadlineExceeded) as e:
+                return None, e
 
-    def get_artist_details(self, artist_id, access_token):
+        if len(genre_names) == 1:
+            # A single genre (the common case) doesn't need a thread
+            outcomes = [fetch(genre_names[0])]
+        else:
+            # Each thread runs in a copy of this context, so it reads and writes through the request's cache
+            with ThreadPoolExecutor(max_workers=len(genre_names)) as executor:
+                futures = [executor.submit(copy_context().run, fetch, genre_name) for genre_name in genre_names]
+                outcomes = [future.result() for future in futures]
+
+        results, errors = {}, {}
+        for genre_name, (artist_ids, error) in zip(genre_names, outcomes):
+            if error is None:
+                results[genre_name] = artist_ids
+            else:
+                logger.warning(f"No artists for genre '{genre_name}': {str(error)}")
+                errors[genre_name] = error
+
+        return results, errors
+
+
+# Fold the genres of artists cached since the last run into the co-occurrence index and refresh the affected
+    # `related_genres:*` entries. Artists already counted are skipped, so each run only pays for new ones;
+    # `rebuild=True` starts over from the queue plus the artists currently in cache (e.g. after changing the scoring) -
+    # that forgets artists whose details have already expired, so it is not scheduled.
+    def update_genre_index(self, rebuild=False):
+        logger.info(f"SpotifyService.update_genre_index(rebuild={rebuild}) called")
+
+        index = None if rebuild else cache.get(self.GENRE_INDEX_STATE_KEY)
+        if index is None:
+            index = GenreCooccurrenceIndex()
+
+        # Every artist cached since the last run was queued with its genres (queue_for_genre_index)
+        redis = get_redis_connection("default")
+        queued = redis.hgetall(self.GENRE_INDEX_QUEUE_KEY)
+        artist_genres = {
+            artist_id.decode(): json.loads(genres)
+            for artist_id, genres in queued.items()
+            if artist_id.decode() not in index.artist_ids
+        }
+
+        # Starting over - add whatever artist_details:* still holds (detail lookups, search and top-artist payloads)
+        if rebuild:
+            batch = []
+            for key in cache.iter_keys("artist_details:*"):
+                batch.append(key)
+                if len(batch) >= self.GENRE_INDEX_SCAN_BATCH:
+                    artist_genres.update(self.collect_artist_genres(batch, index))
+                    batch = []
+            artist_genres.update(self.collect_artist_genres(batch, index))
+
+        touched = index.add_artists(artist_genres)
+        if not touched:
+            self.clear_genre_index_queue(redis, queued)
+            logger.info("Genre index is up to date - no new artists")
+            return 0
+
+        related = index.related_genres(
+            k=self.RELATED_GENRES_COUNT,
+            only=None if rebuild else index.neighbourhood(touched),
+        )
+        cache.set_many({f"related_genres:{genre}": genres for genre, genres in related.items()}, timeout=None)
+        cache.set(self.GENRE_INDEX_STATE_KEY, index, timeout=None)
+        self.clear_genre_index_queue(redis, queued)
+
+        logger.info(f"Genre index: {len(artist_genres)} new artists, {len(related)} related-genre lists updated")
+        return len(artist_genres)
+
+
+# Drop the queued artists this run has indexed - only those, more may have been queued meanwhile.
+    def clear_genre_index_queue(self, redis, queued):
+        if queued:
+            redis.hdel(self.GENRE_INDEX_QUEUE_KEY, *queued)
+
+
+    def collect_artist_genres(self, keys, index):
+        # Skip the fetch entirely for artists already in the index
+        keys = [key for key in keys if key.split(":", 1)[1] not in index.artist_ids]
+        if not keys:
+            return {}
+
+        return {
+            artist["spotify_id"]: artist.get("genres", [])
+            for artist in cache.get_many(keys).values()
+            if artist and artist.get("spotify_id")
+        }
+
+
+# Type-ahead artist search. Answered from this process' prefix index (every artist we've cached);
+    # Spotify is asked only for prefixes the index barely knows (fewer than ARTIST_SEARCH_REMOTE_BELOW matches, 3+ characters),
+    # at most once per ARTIST_SEARCH_DEBOUNCE seconds per client, and its answer is cached per prefix.
+    # The index is kept up to date by a background thread - a request only ever looks it up.
+    def search_artists(self, query, request, client_key, limit=ARTIST_SEARCH_LIMIT, deadline=None):
+        """
+        Return (artists, degraded): up to `limit` artists ({"id", "name", "popularity", "image_url"}) matching
+        the name prefix, and whether that's less than a full answer (index not built yet, debounced, Spotify failed).
+        """
+        logger.info(f"SpotifyService.search_artists('{query}') called")
+
+        self.start_artist_search_refresher()
+
+        prefix = normalize_search_text(query)
+        if not prefix:
+            return [], False
+
+        degraded = self.artist_search_scanned_at is None
+        results = self.artist_search_index.search(prefix, limit)
+        if len(results) >= self.ARTIST_SEARCH_REMOTE_BELOW or len(prefix) < self.ARTIST_SEARCH_REMOTE_MIN_LENGTH:
+            return results, degraded
+
+        remote_key = f"artist_search_remote:{prefix}"
+        remote_artists = cache.get(remote_key)
+
+        if remote_artists is None:
+            # Throttle per client - a fast typist gets local results until the window passes
+            if not cache.add(f"artist_search_debounce:{client_key}", 1, timeout=self.ARTIST_SEARCH_DEBOUNCE):
+                return results, True
+
+            try:
+                access_token = self.get_access_token(request, deadline)
+                found = self.client.search_artists_by_name(prefix, access_token, limit=limit, deadline=deadline)
+            except (SpotifyAPIError, DeadlineExceeded) as e:
+                logger.warning(f"Spotify artist search for '{prefix}' failed, serving local results: {str(e)}")
+                return results, True
+
+            remote_artists = [self.format_artist(artist_data) for artist_data in found if artist_data.get("id")]
+            cache.set(remote_key, remote_artists, timeout=self.ARTIST_SEARCH_REMOTE_CACHE_TIMEOUT)
+            self.cache_artists(found)
+
+        # Into the index, then ask it again - Spotify's fuzzy matches that don't share the prefix are dropped
+        if self.artist_search_index.add_artists(remote_artists):
+            results = self.artist_search_index.search(prefix, limit)
+        return results, degraded
+
+
+# Start this process' search index refresher thread, unless it's running. Started lazily from the first
+    # search, so it runs in every gunicorn worker (threads don't survive the fork) as well as under runserver.
+    def start_artist_search_refresher(self):
+        if self.artist_search_refresher is not None and self.artist_search_refresher.is_alive():
+            return
+
+        with self.artist_search_refresher_lock:
+            if self.artist_search_refresher is not None and self.artist_search_refresher.is_alive():
+                return
+            self.artist_search_refresher = threading.Thread(
+                target=self.run_artist_search_refresher, name="artist-search-refresher", daemon=True
+            )
+            self.artist_search_refresher.start()
+
+
+    def run_artist_search_refresher(self):
+        while True:
+            # An index built before the fork (warm-up) is fresh - wait a full interval before the first rescan
+            if self.artist_search_scanned_at is not None:
+                time.sleep(max(0, self.artist_search_scanned_at + self.ARTIST_SEARCH_RESCAN_INTERVAL - time.monotonic()))
+            try:
+                self.refresh_artist_search_index()
+            except Exception:
+                logger.exception("Artist search index refresh failed")
+                time.sleep(self.ARTIST_SEARCH_RESCAN_INTERVAL)  # not in a tight loop
+
+
+# Add artists cached by other processes (other workers, Celery) to this process' search index.
+    # Only keys of artists not indexed yet are fetched; records this process caches itself are indexed as they arrive.
+    def refresh_artist_search_index(self):
+        logger.info("SpotifyService.refresh_artist_search_index() called")
+
+        indexed = self.artist_search_index.artists
+        added = 0
+        batch = []
+        for key in cache.iter_keys("artist_details:*"):
+            if key.split(":", 1)[1] not in indexed:
+                batch.append(key)
+            if len(batch) >= self.GENRE_INDEX_SCAN_BATCH:
+                added += self.artist_search_index.add_artists(cache.get_many(batch).values())
+                batch = []
+        if batch:
+            added += self.artist_search_index.add_artists(cache.get_many(batch).values())
+
+        self.artist_search_index.merge_pending()
+        self.artist_search_scanned_at = time.monotonic()
+
+        # The first keystroke is the most expensive lookup - have those top-k lists ready
+        for prefix in string.ascii_lowercase + string.digits:
+            self.artist_search_index.search(prefix, self.ARTIST_SEARCH_LIMIT)
+        logger.info(f"Artist search index: {added} artists added, {len(self.artist_search_index)} total")
+        return added
+
+
+# Load artists for every baked-in genre into cache, so the first landing page visitors don't pay for it.
+    def warm_genre_caches(self, access_token, deadline=None):
+        """
+        Prime `artists_for_genre:*` and `artist_details:*` for GENRE_SEEDS, within the deadline's budget.
+        """
+        logger.info("SpotifyService.warm_genre_caches() called")
+
+        for genre_name in self.GENRE_SEEDS:
+            try:
+                artist_ids = self.get_artists_by_genre(genre_name, access_token, deadline)
+                self.get_artists_details_bulk(artist_ids, access_token, deadline)
+            except DeadlineExceeded:
+                logger.warning(f"Warm-up budget spent at genre '{genre_name}' - the rest will be cached on demand")
+                return
+            except SpotifyServiceError as e:
+                logger.warning(f"Could not warm cache for genre '{genre_name}': {str(e)}")
+
+
+    def get_artist_details(self, artist_id, access_token, deadline=None):
         """
         Fetch details for a single artist, with Redis caching.
         """
@@ -189,26 +799,27 @@ class SpotifyService:
         cache_key = f"artist_details:{artist_id}"
         
         cached = cache.get(cache_key)
+        reads = self.track_reads("artist_details", [cache_key], [cache_key] if cached else [])
 
         if cached:
             logger.debug(f"Cache hit for {cache_key}")
 
             return cached
 
+        return self.fetch_artist_details(artist_id, access_token, deadline, reads.get(cache_key))
+
+
+# Fetch one artist from Spotify and cache it for as long as its read count earns it.
+    def fetch_artist_details(self, artist_id, access_token, deadline=None, reads=None):
         try:
-            artist_data = self.client.fetch_artist_details(artist_id, access_token)
-
-            artist_info = {
-                "spotify_id": artist_data.get("id"),
-                "name": artist_data.get("name"),
-                "popularity": artist_data.get("popularity", 0),
-                "genres": artist_data.get("genres", []),
-                "followers": artist_data.get("followers", {}).get("total", 0),
-                "image_url": artist_data['images'][0]['url'] if artist_data.get('images') else None,
-                "external_url": artist_data.get("external_urls", {}).get("spotify", "")
-            }
+            artist_data = self.client.fetch_artist_details(artist_id, access_token, deadline)
 
-            cache.set(cache_key, artist_info, timeout=60 * 60)  # Cache for 1 hour
+            artist_info = self.format_artist(artist_data)
+
+            timeout = self.adaptive_timeout("artist_details", reads)
+            cache.set(f"artist_details:{artist_id}", artist_info, timeout=timeout)
+            self.artist_search_index.add_artists([artist_info])
+            self.queue_for_genre_index([artist_info])
             logger.debug(f"Cached artist details for {artist_id}")
 
             return artist_info
@@ -217,22 +828,39 @@ class SpotifyService:
             logger.error(f"Error fetching artist details for ID '{artist_id}': {str(e)}")
             raise SpotifyServiceError("Failed to fetch artist details") from e
 
+        except DeadlineExceeded:
+            raise
+
         except Exception as e:
-            logger.exception("Unexpected error in get_artist_details()")
-            raise SpotifyServiceError("Unexpected error in get_artist_details()") from e
+            logger.exception("Unexpected error in fetch_artist_details()")
+            raise SpotifyServiceError("Unexpected error in fetch_artist_details()") from e
 
 
-    def get_artists_details_bulk(self, artist_ids, access_token):
+    def get_artists_details_bulk(self, artist_ids, access_token, deadline=None):
         """
         Fetch details for a list of artist IDs.
+        Cached artists are read (and their reads recorded) in one round trip, only the rest are fetched.
+        If the deadline runs out, the artists not fetched yet are left out (possibly a partial list).
         """
         logger.info(f"SpotifyService.get_artists_details_bulk() called for {len(artist_ids)} artists")
 
+        keys = [f"artist_details:{artist_id}" for artist_id in artist_ids]
+        cached = cache.get_many(keys)
+        reads = self.track_reads("artist_details", keys, list(cached))
+
         details_list = []
+        out_of_time = False
         
-        for artist_id in artist_ids:
+        for artist_id, key in zip(artist_ids, keys):
+            if key in cached:
+                details_list.append(cached[key])
+                continue
+
+            if out_of_time:
+                continue
+
             try:
-                details = self.get_artist_details(artist_id, access_token)
+                details = self.fetch_artist_details(artist_id, access_token, deadline, reads.get(key))
                 
                 details_list.append(details)
             
@@ -240,6 +868,10 @@ class SpotifyService:
                 logger.warning(f"Skipping artist ID '{artist_id}' due to error: {str(e)}")
                 
                 continue  # Skip failed artist and continue
+
+            except DeadlineExceeded:
+                logger.warning("Deadline reached - serving the remaining artists from cache only")
+                out_of_time = True
         
         logger.debug(f"Successfully fetched details for {len(details_list)} artists")
         
@@ -0,0 +1,112 @@
+import gzip
+import io
+import logging
+import posixpath
+
+import brotli
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from fontTools import subset
+
+logger = logging.getLogger(__name__)
+
+
+# Static files storage used by `collectstatic` in production.
+    # On top of Django's content-hashed filenames it converts our display fonts to subsetted woff2
+    # and writes `.gz` / `.br` siblings so nginx can serve them with `gzip_static` / `brotli_static`.
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    FONT_EXTENSIONS = (".ttf", ".otf")
+
+    # Text-like assets worth precompressing - images and woff2 are already compressed.
+    COMPRESSIBLE_EXTENSIONS = (".css", ".js", ".svg", ".txt", ".json", ".html", ".ttf", ".otf")
+    MIN_COMPRESS_SIZE = 256
+
+    # Basic Latin + Latin-1 Supplement, matches the `unicode-range` declared in style.css
+    FONT_UNICODES = list(range(0x20, 0x7F)) + list(range(0xA0, 0x100))
+
+    def post_process(self, paths, dry_run=False, **options):
+        """
+        Build woff2 fonts, hash everything, then precompress the hashed files.
+        """
+        if not dry_run:
+            # woff2 files have to exist before hashing so the CSS url() references resolve
+            paths.update(self.build_woff2_fonts(paths))
+
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+
+        if dry_run:
+            return
+
+        for hashed_name in sorted(set(self.hashed_files.values())):
+            self.write_precompressed(hashed_name)
+
+
+# Convert every .ttf/.otf collected into a Latin-subsetted woff2 next to it.
+    def build_woff2_fonts(self, paths):
+        built = {}
+
+        for path in list(paths):
+            root, ext = posixpath.splitext(path)
+            if ext.lower() not in self.FONT_EXTENSIONS:
+                continue
+
+            woff2_name = f"{root}.woff2"
+
+            try:
+                with self.open(path) as original:
+                    data = self.subset_font(original.read())
+            except Exception:
+                logger.exception(f"Failed to build woff2 font from '{path}'")
+                continue
+
+            if self.exists(woff2_name):
+                self.delete(woff2_name)
+            self.save(woff2_name, ContentFile(data))
+
+            built[woff2_name] = (self, woff2_name)
+            logger.info(f"Built {woff2_name} ({len(data)} bytes) from {path}")
+
+        return built
+
+
+    def subset_font(self, data):
+        """
+        Subset font bytes to FONT_UNICODES and return them as woff2.
+        """
+        options = subset.Options()
+        options.flavor = "woff2"
+        options.layout_features = ["*"]
+
+        font = subset.load_font(io.BytesIO(data), options)
+        subsetter = subset.Subsetter(options)
+        subsetter.populate(unicodes=self.FONT_UNICODES)
+        subsetter.subset(font)
+
+        output = io.BytesIO()
+        subset.save_font(font, output, options)
+        return output.getvalue()
+
+
+# Write `name.gz` and `name.br` for a collected file, only when it actually gets smaller.
+    def write_precompressed(self, name):
+        if not name.lower().endswith(self.COMPRESSIBLE_EXTENSIONS):
+            return
+
+        with self.open(name) as original:
+            data = original.read()
+
+        if len(data) < self.MIN_COMPRESS_SIZE:
+            return
+
+        variants = {
+            f"{name}.gz": gzip.compress(data, compresslevel=9, mtime=0),
+            f"{name}.br": brotli.compress(data, quality=11),
+        }
+
+        for compressed_name, compressed in variants.items():
+            if len(compressed) >= len(data):
+                continue
+
+            if self.exists(compressed_name):
+                self.delete(compressed_name)
+            self.save(compressed_name, ContentFile(compressed))
@@ -1,7 +1,99 @@
+import logging
+import secrets
+import time
 from celery import shared_task
-from .services.spotify_service import SpotifyService
+from django.core.cache import cache as shared_cache
+from .request_cache import cache
+from .services.spotify_service import SpotifyService, SpotifyServiceError
+
+logger = logging.getLogger(__name__)
+
+# How many of the user's top genres get their artist lists prefetched after login
+PREFETCH_GENRE_COUNT = 3
+
+# The access token is handed to prefetch_user_data through the cache - this long for a worker to pick it up
+PREFETCH_TOKEN_TIMEOUT = 60
+# "Prefetch in progress" marker: its lifetime (a lost task stops mattering after it), and how long home_view waits on it
+PREFETCH_MARKER_TIMEOUT = 30
+PREFETCH_WAIT = 2.0
+PREFETCH_POLL_INTERVAL = 0.1
+
+# One service (and HTTP connection pool) per worker process, shared by every task run - as in views.py
+spotify_service = SpotifyService()
+
 
 @shared_task
 def refresh_client_token():
-    service = SpotifyService()
-    service.client.authenticate_client()
+    spotify_service.client.authenticate_client()
+
+
+# Queue prefetch_user_data for a user who just logged in. The token never goes on the broker (nor into Celery's
+    # task / failure logs): it's parked in the cache under a random key that expires shortly, and the task gets the key.
+    # A per-user marker says a prefetch is in flight, so home_view can wait for it instead of fetching everything too.
+def queue_prefetch_user_data(access_token):
+    reference = secrets.token_urlsafe(16)
+    marker_key = SpotifyService.user_cache_key("prefetch_in_progress", access_token)
+
+    # add(), not set(): written right away - a worker may start the task before this request's writes are flushed
+    cache.add(f"prefetch_token:{reference}", access_token, timeout=PREFETCH_TOKEN_TIMEOUT)
+    cache.add(marker_key, reference, timeout=PREFETCH_MARKER_TIMEOUT)
+    try:
+        prefetch_user_data.delay(reference)
+    except Exception:
+        cache.delete(marker_key)
+        raise
+
+
+# Wait (at most `timeout` seconds) for a prefetch of this user's data queued at login. Polls the shared cache
+    # directly - the request's cache would keep answering with the first read.
+def wait_for_prefetch(access_token, timeout):
+    """
+    Return True if no prefetch is in flight (any more), False if we stopped waiting.
+    """
+    marker_key = SpotifyService.user_cache_key("prefetch_in_progress", access_token)
+    give_up_at = time.monotonic() + timeout
+
+    while shared_cache.get(marker_key) is not None:
+        if time.monotonic() >= give_up_at:
+            return False
+        time.sleep(PREFETCH_POLL_INTERVAL)
+    return True
+
+
+# Queued by `queue_prefetch_user_data` right after login, while the browser follows the redirect to `home`.
+    # Fills the same cache entries `home_view` reads: profile, top genres, the top genres' artist lists
+    # and every artist object seen along the way.
+@shared_task(ignore_result=True)
+def prefetch_user_data(token_reference):
+    access_token = cache.get(f"prefetch_token:{token_reference}")
+    if access_token is None:
+        logger.warning("Prefetch of user data skipped - the token reference has expired")
+        return
+    cache.delete(f"prefetch_token:{token_reference}")
+
+    try:
+        prefetch_top_genres(spotify_service, access_token)
+    finally:
+        cache.delete(SpotifyService.user_cache_key("prefetch_in_progress", access_token))
+
+
+def prefetch_top_genres(service, access_token):
+    try:
+        user_profile = service.get_user_profile(access_token)
+        top_genres, _ = service.get_user_top_genres(access_token, user_id=user_profile["id"])
+    except SpotifyServiceError as e:
+        logger.warning(f"Prefetch of user data failed: {str(e)}")
+        return
+
+    for genre_name in top_genres[:PREFETCH_GENRE_COUNT]:
+        try:
+            artist_ids = service.get_artists_by_genre(genre_name, access_token)
+            service.get_artists_details_bulk(artist_ids, access_token)
+        except SpotifyServiceError as e:
+            logger.warning(f"Prefetch of genre '{genre_name}' failed: {str(e)}")
+
+
+# Periodic (see CELERY_BEAT_SCHEDULE) - folds newly seen artists into the related-genres index.
+@shared_task(ignore_result=True)
+def update_genre_index(rebuild=False):
+    spotify_service.update_genre_index(rebuild=rebuild)
@@ -0,0 +1,58 @@
+import hashlib
+
+from django import template
+from django.core.cache import caches
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+register = template.Library()
+
+ARTIST_CARD_TEMPLATE = "WebApplication/includes/artist_card.html"
+GENRE_NAV_TEMPLATE = "WebApplication/includes/genre_nav.html"
+
+# Artist fields that end up in the card markup - a change to any of them is a new record version
+ARTIST_CARD_FIELDS = ("spotify_id", "name", "image_url", "popularity")
+
+
+# Version of an artist record as far as its card is concerned.
+def artist_card_version(artist):
+    fingerprint = "\x1f".join(str(artist.get(field)) for field in ARTIST_CARD_FIELDS)
+    return hashlib.sha1(fingerprint.encode()).hexdigest()[:12]
+
+
+# Rendered artist cards, cached per artist + record version in the process-local "fragments" cache.
+    # Only cards not rendered before (or whose record changed) hit the template engine; the list is a join.
+@register.simple_tag
+def artist_cards(artists):
+    fragments = caches["fragments"]
+
+    keys = [f"artist_card:{artist['spotify_id']}:{artist_card_version(artist)}" for artist in artists]
+    cached = fragments.get_many(keys)
+
+    cards = []
+    rendered = {}
+    for key, artist in zip(keys, artists):
+        card = cached.get(key)
+        if card is None:
+            card = rendered[key] = render_to_string(ARTIST_CARD_TEMPLATE, {"artist": artist})
+        cards.append(card)
+
+    if rendered:
+        fragments.set_many(rendered)
+
+    return mark_safe("".join(cards))
+
+
+# Genre navigation list, rendered once per process for each distinct list of genres
+    # (GENRE_SEEDS on the landing page, a user's top genres on home).
+@register.simple_tag
+def genre_nav(genres):
+    fragments = caches["fragments"]
+
+    key = "genre_nav:" + hashlib.sha1("\x1f".join(genres).encode()).hexdigest()
+    nav = fragments.get(key)
+    if nav is None:
+        nav = render_to_string(GENRE_NAV_TEMPLATE, {"genres": genres})
+        fragments.set(key, nav)
+
+    return mark_safe(nav)
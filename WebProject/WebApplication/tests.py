@@ -1,3 +1,903 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import os
+import random
+import shutil
+import tempfile
+import time
+from unittest import mock
 
-# Create your tests here.
+import brotli
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from . import tasks, views, warmup
+from .clients.spotify import SpotifyAPIError
+from .deadline import Deadline, DeadlineExceeded
+from .middleware import CompressionMiddleware, RequestCacheMiddleware, RequestProfilerMiddleware, minify_html
+from .profiling import PROFILE_TOKEN_SALT, make_profile_token, profile_filename
+from .request_cache import RequestCache, activate, cache as request_cache, deactivate
+from .services.access_tracker import AccessTracker
+from .services.artist_search import ArtistPrefixIndex, normalize_search_text
+from .services.genre_index import GenreCooccurrenceIndex
+from .services.spotify_service import InvalidGenre, SpotifyService, SpotifyServiceError
+from .templatetags import fragments
+
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "tests-default"},
+    "fragments": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "tests-fragments"},
+}
+
+
+# Stand-in for a django_redis cache: values live in a LocMemCache, writes given `client=<pipeline>` are queued
+    # on that pipeline, and every call that would reach Redis is counted as a round trip.
+class PipelinedCache:
+    def __init__(self):
+        self.store = LocMemCache("tests-pipelined", {})
+        self.store.clear()  # local-memory caches with the same name share their data
+        self.client = self
+        self.round_trips = 0
+        self.pipelines = []
+
+    def get_client(self, write=True):
+        return self
+
+    def pipeline(self, transaction=True):
+        pipeline = FakePipeline(self)
+        self.pipelines.append(pipeline)
+        return pipeline
+
+    def get(self, key, default=None):
+        self.round_trips += 1
+        return self.store.get(key, default)
+
+    def get_many(self, keys):
+        self.round_trips += 1
+        return self.store.get_many(keys)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT):
+        self.round_trips += 1
+        return self.store.add(key, value, timeout)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, client=None):
+        self.write(client, ("set", key, value, timeout))
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, client=None):
+        self.write(client, ("touch", key, timeout))
+
+    def delete(self, key, client=None):
+        self.write(client, ("delete", key))
+
+    def write(self, client, command):
+        if client is None:
+            self.round_trips += 1
+            self.apply(command)
+        else:
+            client.commands.append(command)
+
+    def apply(self, command):
+        name, key, *args = command
+        if name in ("set", "touch"):
+            getattr(self.store, name)(key, *args)
+        elif name == "delete":
+            self.store.delete(key)
+
+
+class FakePipeline:
+    def __init__(self, cache):
+        self.cache = cache
+        self.commands = []
+
+    def execute_command(self, *args):
+        self.commands.append(("command", *args))
+
+    def expire(self, key, seconds):
+        self.commands.append(("expire", key, seconds))
+
+    def hincrby(self, key, field, increment):
+        self.commands.append(("hincrby", key, field, increment))
+
+    def hset(self, key, mapping):
+        self.commands.append(("hset", key, mapping))
+
+    def execute(self):
+        self.cache.round_trips += 1
+        for command in self.commands:
+            self.cache.apply(command)
+        return [True] * len(self.commands)
+
+
+@override_settings(
+    RESPONSE_MINIFY_HTML=True,
+    RESPONSE_COMPRESSION_MIN_SIZE=200,
+    RESPONSE_COMPRESSION_BREACH_MAX_RANDOM_BYTES=100,
+)
+class CompressionMiddlewareTests(SimpleTestCase):
+    HTML = "<html>\n  <body>\n    <!-- comment -->\n" + "    <p>Artist   card</p>\n" * 40 + "<pre>  keep\n  this </pre></body></html>"
+
+    def respond(self, html, accept_encoding, **headers):
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING=accept_encoding)
+        middleware = CompressionMiddleware(lambda request: HttpResponse(html, headers=headers))
+        return middleware(request)
+
+    def test_minify_html(self):
+        minified = minify_html(self.HTML)
+        self.assertNotIn("comment", minified)
+        self.assertIn("<p>Artist card</p> <p>", minified)
+        self.assertIn("<pre>  keep\n  this </pre>", minified)
+
+    def test_brotli_preferred(self):
+        response = self.respond(self.HTML, "gzip, br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(brotli.decompress(response.content).decode(), minify_html(self.HTML))
+        self.assertEqual(response["Content-Length"], str(len(response.content)))
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+    def test_gzip_and_refused_codings(self):
+        self.assertEqual(self.respond(self.HTML, "br;q=0, gzip")["Content-Encoding"], "gzip")
+        self.assertFalse(self.respond(self.HTML, "identity").has_header("Content-Encoding"))
+
+    def test_small_responses_are_left_alone(self):
+        response = self.respond("<p>tiny</p>", "br")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertNotIn("Vary", response)
+
+    def test_strong_etag_is_weakened(self):
+        self.assertEqual(self.respond(self.HTML, "br", ETag='"abc"')["ETag"], 'W/"abc"')
+
+    def test_responses_with_a_csrf_token_get_padded_gzip_only(self):
+        html = self.HTML + '<input type="hidden" name="csrfmiddlewaretoken" value="secret">'
+        responses = [self.respond(html, "br, gzip") for _ in range(20)]
+
+        self.assertEqual({response["Content-Encoding"] for response in responses}, {"gzip"})
+        self.assertEqual(gzip.decompress(responses[0].content).decode(), minify_html(html))
+        # Random-length padding - the compressed size doesn't follow the content
+        self.assertGreater(len({len(response.content) for response in responses}), 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class WarmUpTests(SimpleTestCase):
+    def setUp(self):
+        request_cache.clear()
+        self.client = Client(HTTP_HOST="localhost")
+
+    def worker_state(self, **state):
+        patcher = mock.patch.dict(warmup._state, state)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_always_ready_without_the_gunicorn_hooks(self):
+        self.worker_state(managed=False, ready=False)
+        self.assertEqual(self.client.get("/ready/").status_code, 200)
+
+    def test_ready_once_the_worker_and_the_shared_caches_are_warm(self):
+        self.worker_state(managed=True, ready=False)
+        with self.assertLogs("django.request", "ERROR"):
+            self.assertEqual(self.client.get("/ready/").status_code, 503)
+
+        self.worker_state(ready=True)
+        with self.assertLogs("django.request", "ERROR"):
+            self.assertEqual(self.client.get("/ready/").status_code, 503)  # master hasn't recorded its warm-up yet
+
+        request_cache.set(warmup.SHARED_WARMUP_KEY, {"finished_at": 1.0, "errors": []})
+        response = self.client.get("/ready/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["shared"], {"finished_at": 1.0, "errors": []})
+
+    def test_not_ready_when_redis_is_down(self):
+        self.worker_state(managed=True, ready=True)
+        with mock.patch.object(warmup.cache, "get", side_effect=ConnectionError("down")):
+            status = warmup.warmup_status()
+        self.assertFalse(status["ready"])
+        self.assertEqual(status["errors"], ["shared warm-up state: down"])
+
+    @override_settings(WARMUP_DEADLINE=5.0)
+    def test_shared_warm_up_is_recorded_and_bounded(self):
+        self.worker_state(managed=False)
+        service = views.spotify_service
+        with mock.patch.object(service.client, "get_client_access_token", return_value="token") as get_token, \
+                mock.patch.object(service, "warm_genre_caches") as warm_genre_caches, \
+                mock.patch.object(service, "refresh_artist_search_index"), \
+                mock.patch.object(service.client, "close"):
+            warmup.warm_up_shared_caches()
+
+        (deadline,), _ = get_token.call_args
+        self.assertEqual(deadline.seconds, 5.0)
+        warm_genre_caches.assert_called_once_with("token", deadline)
+        self.assertEqual(request_cache.get(warmup.SHARED_WARMUP_KEY)["errors"], [])
+
+    def test_failed_shared_warm_up_is_still_recorded(self):
+        self.worker_state(managed=False)
+        service = views.spotify_service
+        with mock.patch.object(service.client, "get_client_access_token", side_effect=SpotifyAPIError("401")), \
+                mock.patch.object(service.client, "close"), \
+                self.assertLogs("WebApplication.warmup", "ERROR"):
+            warmup.warm_up_shared_caches()
+
+        self.assertEqual(request_cache.get(warmup.SHARED_WARMUP_KEY)["errors"], ["401"])
+
+    def test_genre_warm_up_stops_when_the_budget_is_spent(self):
+        service = SpotifyService()
+        with mock.patch.object(service, "get_artists_by_genre", side_effect=DeadlineExceeded("spent")) as get_artists, \
+                self.assertLogs("WebApplication.services.spotify_service", "WARNING"):
+            service.warm_genre_caches("token", Deadline(0))
+        self.assertEqual(get_artists.call_count, 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PrefetchUserDataTests(SimpleTestCase):
+    def setUp(self):
+        request_cache.clear()
+        self.marker_key = SpotifyService.user_cache_key("prefetch_in_progress", "user-token")
+
+    def queue(self):
+        with mock.patch.object(tasks.prefetch_user_data, "delay") as delay:
+            tasks.queue_prefetch_user_data("user-token")
+        (reference,), _ = delay.call_args
+        return reference
+
+    def test_the_token_stays_off_the_broker(self):
+        reference = self.queue()
+
+        self.assertNotIn("user-token", reference)
+        self.assertEqual(request_cache.get(f"prefetch_token:{reference}"), "user-token")
+        self.assertEqual(request_cache.get(self.marker_key), reference)
+        self.assertFalse(tasks.wait_for_prefetch("user-token", timeout=0))
+
+    def test_marker_is_cleared_when_queueing_fails(self):
+        with mock.patch.object(tasks.prefetch_user_data, "delay", side_effect=ConnectionError("broker down")):
+            with self.assertRaises(ConnectionError):
+                tasks.queue_prefetch_user_data("user-token")
+        self.assertTrue(tasks.wait_for_prefetch("user-token", timeout=0))
+
+    def test_task_uses_the_parked_token_once(self):
+        reference = self.queue()
+
+        with mock.patch.object(tasks, "prefetch_top_genres") as prefetch_top_genres:
+            tasks.prefetch_user_data(reference)
+
+        prefetch_top_genres.assert_called_once_with(tasks.spotify_service, "user-token")
+        self.assertIsNone(request_cache.get(f"prefetch_token:{reference}"))
+        self.assertTrue(tasks.wait_for_prefetch("user-token", timeout=0))
+
+    def test_marker_is_cleared_when_the_task_fails(self):
+        reference = self.queue()
+
+        with mock.patch.object(tasks, "prefetch_top_genres", side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                tasks.prefetch_user_data(reference)
+        self.assertTrue(tasks.wait_for_prefetch("user-token", timeout=0))
+
+    def test_expired_reference_is_a_no_op(self):
+        with mock.patch.object(tasks, "prefetch_top_genres") as prefetch_top_genres, \
+                self.assertLogs("WebApplication.tasks", "WARNING"):
+            tasks.prefetch_user_data("expired")
+        prefetch_top_genres.assert_not_called()
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SpotifyServiceTests(SimpleTestCase):
+    def setUp(self):
+        self.service = SpotifyService()
+        request_cache.clear()
+
+    def test_normalize_genre(self):
+        for variant in ("  Hip_Hop ", "HIP  HOP", "hip hop"):
+            self.assertEqual(self.service.normalize_genre(variant), "hip hop")
+        self.assertEqual(self.service.normalize_genre("R&B"), "r&b")
+
+    def test_normalize_genre_rejects_junk(self):
+        for junk in ("", "   ", "<script>", "x" * (SpotifyService.GENRE_MAX_LENGTH + 1), None, 42, ["metal"]):
+            with self.assertRaises(InvalidGenre):
+                self.service.normalize_genre(junk)
+
+    def test_normalize_genre_selection(self):
+        selected = self.service.normalize_genre_selection(["Metal", "metal ", "jazz", "rock", "pop", "blues"])
+        self.assertEqual(selected, ["metal", "jazz", "rock"])  # the duplicate takes one of the MAX_SELECTED_GENRES slots
+
+    def test_cache_artists_keeps_cached_records(self):
+        request_cache.set("artist_details:hot", {"spotify_id": "hot", "name": "Cached"}, timeout=600)
+
+        self.service.cache_artists([spotify_artist("hot", "From payload"), spotify_artist("new", "New")], timeout=60)
+
+        self.assertEqual(request_cache.get("artist_details:hot")["name"], "Cached")
+        self.assertEqual(request_cache.get("artist_details:new")["name"], "New")
+
+    def test_top_genres_weigh_recent_ranges_and_high_ranks(self):
+        top_artists = {
+            "short_term": [["pop"], ["rock"]],           # pop 3 x 1,   rock 3 x 1/2
+            "medium_term": [["rock"], ["jazz"]],         # rock 2 x 1,  jazz 2 x 1/2
+            "long_term": [["metal"], ["jazz"], ["pop"]], # metal 1 x 1, jazz 1 x 2/3, pop 1 x 1/3
+        }
+        self.mock_top_artists(top_artists)
+
+        top_genres, partial = self.service.get_user_top_genres("token", user_id="user")
+
+        self.assertEqual(top_genres, ["rock", "pop", "jazz", "metal"])
+        self.assertFalse(partial)
+        self.assertEqual(request_cache.get("user_top_artist_genres:user:medium_term"), [["rock"], ["jazz"]])
+
+        # Served from the cache the second time
+        self.service.client.get_user_top_artists.reset_mock()
+        self.assertEqual(self.service.get_user_top_genres("token", user_id="user"), (top_genres, False))
+        self.service.client.get_user_top_artists.assert_not_called()
+
+    def test_top_genres_without_a_time_range_are_partial_and_not_cached(self):
+        self.mock_top_artists({"short_term": SpotifyAPIError("Spotify 503"), "medium_term": [["rock"]], "long_term": [["jazz"]]})
+
+        with self.assertLogs("WebApplication.services.spotify_service", "ERROR"):
+            top_genres, partial = self.service.get_user_top_genres("token", user_id="user")
+
+        self.assertEqual(top_genres, ["rock", "jazz"])
+        self.assertTrue(partial)
+        for time_range in SpotifyService.TIME_RANGE_WEIGHTS:
+            self.assertIsNone(request_cache.get(f"user_top_artist_genres:user:{time_range}"))
+
+    def test_top_genres_fail_when_every_time_range_fails(self):
+        self.mock_top_artists({time_range: SpotifyAPIError("Spotify 503") for time_range in SpotifyService.TIME_RANGE_WEIGHTS})
+        with self.assertRaises(SpotifyServiceError), self.assertLogs("WebApplication.services.spotify_service", "ERROR"):
+            self.service.get_user_top_genres("token", user_id="user")
+
+    def mock_top_artists(self, by_time_range):
+        def get_user_top_artists(access_token, limit=20, time_range="long_term", deadline=None):
+            if isinstance(by_time_range[time_range], Exception):
+                raise by_time_range[time_range]
+            return {"items": [
+                dict(spotify_artist(f"{time_range}-{rank}", f"Artist {rank}"), genres=genres)
+                for rank, genres in enumerate(by_time_range[time_range])
+            ]}
+
+        patcher = mock.patch.object(self.service.client, "get_user_top_artists", side_effect=get_user_top_artists)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_payload_artists_are_admitted_by_their_own_reads(self):
+        backend = PipelinedCache()
+        request_writes = RequestCache(backend)
+        token = activate(request_writes)
+        try:
+            reads = {"artist_details:hot": 25, "artist_details:once": 0}
+            with mock.patch.object(self.service.access_tracker, "estimate", return_value=reads):
+                self.service.cache_artists([
+                    dict(spotify_artist("hot", "Hot"), genres=["metal", "rock"]),
+                    spotify_artist("once", "Once"),
+                    spotify_artist("untracked", "Untracked"),
+                ])
+        finally:
+            deactivate(token)
+        request_writes.flush()
+
+        commands = backend.pipelines[0].commands
+        timeouts = {command[1]: command[3] for command in commands if command[0] == "set"}
+        self.assertEqual(timeouts, {
+            "artist_details:hot": 60 * 60 * 6,
+            "artist_details:once": 60 * 2,
+            "artist_details:untracked": SpotifyService.ARTIST_CACHE_TIMEOUT,
+        })
+        # Only artists with genres are queued for the genre index
+        self.assertIn(("hset", SpotifyService.GENRE_INDEX_QUEUE_KEY, {"hot": '["metal", "rock"]'}), commands)
+
+    def test_genre_index_is_fed_from_the_queue(self):
+        redis = mock.Mock()
+        redis.hgetall.return_value = {
+            b"a1": b'["metal", "rock"]', b"a2": b'["metal", "rock"]', b"a3": b'["jazz"]',
+        }
+
+        with mock.patch("WebApplication.services.spotify_service.get_redis_connection", return_value=redis):
+            self.assertEqual(self.service.update_genre_index(), 3)
+            self.assertEqual(self.service.update_genre_index(), 0)  # nothing new - already counted
+
+        self.assertEqual(request_cache.get("related_genres:metal"), ["rock"])
+        self.assertEqual(request_cache.get(SpotifyService.GENRE_INDEX_STATE_KEY).artist_ids, {"a1", "a2", "a3"})
+        for call in redis.hdel.call_args_list:
+            self.assertEqual(call.args, (SpotifyService.GENRE_INDEX_QUEUE_KEY, b"a1", b"a2", b"a3"))
+        self.assertEqual(redis.hdel.call_count, 2)
+
+    def test_related_genres_for_a_selection_take_turns(self):
+        request_cache.set_many({
+            "related_genres:metal": ["rock", "thrash metal", "jazz"],
+            "related_genres:jazz": ["bebop", "rock", "metal"],
+        })
+        self.assertEqual(self.service.get_related_genres_for_selection(["metal"]), ["rock", "thrash metal", "jazz"])
+        self.assertEqual(
+            self.service.get_related_genres_for_selection(["metal", "jazz"]), ["rock", "bebop", "thrash metal"]
+        )
+        self.assertEqual(self.service.get_related_genres_for_selection(["unknown"]), [])
+
+    def test_failed_genres_make_the_result_partial(self):
+        def get_artists_by_genre(genre_name, access_token, deadline=None):
+            if genre_name == "jazz":
+                raise SpotifyServiceError("Spotify 503")
+            return ["m1"]
+
+        with mock.patch.object(self.service, "get_artists_by_genre", side_effect=get_artists_by_genre), \
+                mock.patch.object(self.service, "get_artists_details_bulk", return_value=[{"spotify_id": "m1"}]):
+            result = self.service.get_artists_for_genres(["metal", "jazz"], "token")
+
+        self.assertEqual(result["failed_genres"], ["jazz"])
+        self.assertEqual(result["missing_genres"], [])
+        self.assertTrue(result["partial"])
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    STORAGES={"staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}},
+    SESSION_ENGINE="django.contrib.sessions.backends.signed_cookies",
+)
+class PublicCacheHeadersTests(SimpleTestCase):
+    ARTISTS = {"artists": [], "missing_genres": [], "failed_genres": [], "partial": False}
+
+    def setUp(self):
+        self.client = Client(HTTP_HOST="localhost")
+        service = views.spotify_service
+        for name, value in (
+            ("get_access_token", "token"),
+            ("prefetch_page", None),
+            ("get_related_genres_for_selection", []),
+            ("get_artists_for_genres", self.ARTISTS),
+            ("get_artist_details", {"spotify_id": "a1", "name": "Artist", "genres": [], "popularity": 1}),
+        ):
+            patcher = mock.patch.object(service, name, return_value=value)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+
+    def log_in(self):
+        session = self.client.session
+        session.update({"is_spotify_authenticated": True, "spotify_access_token": "user-token"})
+        session.save()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+    def assert_shared(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.cookies, {})
+        self.assertNotIn("Cookie", response.get("Vary", ""))
+        self.assertEqual(response["Cache-Control"], f"public, max-age={settings.PUBLIC_PAGE_MAX_AGE}")
+
+    def test_anonymous_pages_are_public_and_sessionless(self):
+        for url in ("/", "/?genre_name=jazz", "/artist/a1/", "/about/"):
+            with self.subTest(url=url):
+                self.assert_shared(self.client.get(url))
+
+    def test_logged_in_pages_are_private(self):
+        self.log_in()
+        for url in ("/", "/artist/a1/", "/about/"):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response["Cache-Control"], "private")
+                self.assertIn("Cookie", response["Vary"])
+
+    def test_error_and_partial_pages_are_not_shared(self):
+        self.get_artists_for_genres.side_effect = SpotifyServiceError("Spotify 503")
+        self.assertEqual(self.client.get("/")["Cache-Control"], "no-cache")
+
+        self.get_artists_for_genres.side_effect = None
+        self.get_artists_for_genres.return_value = dict(self.ARTISTS, failed_genres=["metal"], partial=True)
+        self.assertEqual(self.client.get("/")["Cache-Control"], "no-cache")
+
+        self.get_artist_details.side_effect = DeadlineExceeded()
+        self.assertEqual(self.client.get("/artist/a1/")["Cache-Control"], "no-cache")
+
+        self.assertEqual(self.client.get("/?genre_name=<script>")["Cache-Control"], "no-cache")
+
+
+class GenreCooccurrenceIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = GenreCooccurrenceIndex()
+        self.touched = self.index.add_artists({
+            "a1": ["metal", "thrash metal"],
+            "a2": ["metal", "thrash metal", "rock"],
+            "a3": ["metal", "rock"],
+            "a4": ["metal", "rock"],
+            "a5": ["jazz", "bebop"],
+            "a6": ["jazz", "metal"],
+        })
+
+    def test_related_genres_ranked_by_similarity(self):
+        related = self.index.related_genres(k=8)
+        # Ochiai: rock 3 / sqrt(6 * 3) = 0.71 ranks above thrash metal 2 / sqrt(6 * 2) = 0.58
+        self.assertEqual(related["metal"], ["rock", "thrash metal"])
+        self.assertEqual(related["thrash metal"], ["metal"])
+        # Pairs seen once (jazz + bebop, jazz + metal) are left out
+        self.assertNotIn("jazz", related)
+
+    def test_k_limits_every_row(self):
+        self.assertEqual(self.index.related_genres(k=1)["metal"], ["rock"])
+
+    def test_artists_are_counted_once(self):
+        self.assertEqual(self.index.add_artists({"a1": ["metal", "jazz"]}), set())
+        self.assertEqual(self.index.related_genres()["metal"], ["rock", "thrash metal"])
+
+    def test_incremental_merge_and_neighbourhood(self):
+        self.assertEqual(self.touched, {"metal", "thrash metal", "rock", "jazz", "bebop"})
+
+        touched = self.index.add_artists({"a7": ["jazz", "bebop"]})
+        self.assertEqual(touched, {"jazz", "bebop"})
+        self.assertEqual(self.index.neighbourhood(touched), {"jazz", "bebop", "metal"})
+
+        related = self.index.related_genres(only=self.index.neighbourhood(touched))
+        self.assertEqual(related["jazz"], ["bebop"])
+        self.assertEqual(related["metal"], ["rock", "thrash metal"])
+        self.assertNotIn("rock", related)
+
+    def test_only_gives_every_requested_genre_an_entry(self):
+        self.assertEqual(self.index.related_genres(only=["bebop", "unknown"]), {"bebop": [], "unknown": []})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class FragmentCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches["fragments"].clear()
+        patcher = mock.patch.object(fragments, "render_to_string", wraps=fragments.render_to_string)
+        self.render_to_string = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def render(self, source, **context):
+        self.render_to_string.reset_mock()
+        return Template("{% load fragments %}" + source).render(Context(context))
+
+    def test_artist_cards_are_rendered_once_per_record_version(self):
+        artists = [
+            {"spotify_id": "a1", "name": "Opeth", "image_url": "https://i/1", "popularity": 60, "followers": 10},
+            {"spotify_id": "a2", "name": "Ghost", "image_url": "https://i/2", "popularity": 70, "followers": 20},
+        ]
+
+        html = self.render("{% artist_cards artists %}", artists=artists)
+        self.assertEqual(self.render_to_string.call_count, 2)
+        self.assertLess(html.index("Opeth"), html.index("Ghost"))
+        key = f"artist_card:a1:{fragments.artist_card_version(artists[0])}"
+        self.assertIn("Opeth", caches["fragments"].get(key))
+
+        self.assertEqual(self.render("{% artist_cards artists %}", artists=artists), html)
+        self.assertEqual(self.render_to_string.call_count, 0)
+
+        # Fields the card doesn't show don't matter
+        artists[0]["followers"] = 11
+        self.render("{% artist_cards artists %}", artists=artists)
+        self.assertEqual(self.render_to_string.call_count, 0)
+
+        # A changed record is a new version - only that card is rendered again
+        artists[0]["name"] = "Opeth (band)"
+        html = self.render("{% artist_cards artists %}", artists=artists)
+        self.assertEqual(self.render_to_string.call_count, 1)
+        self.assertIn("Opeth (band)", html)
+        self.assertIn("Ghost", html)
+
+    def test_genre_nav_is_cached_per_genre_list(self):
+        html = self.render("{% genre_nav genres %}", genres=["metal", "rock"])
+        self.assertEqual(self.render_to_string.call_count, 1)
+        key = "genre_nav:" + hashlib.sha1("metal\x1frock".encode()).hexdigest()
+        self.assertEqual(caches["fragments"].get(key), html)
+
+        self.assertEqual(self.render("{% genre_nav genres %}", genres=["metal", "rock"]), html)
+        self.assertEqual(self.render_to_string.call_count, 0)
+
+        for genres in (["rock", "metal"], ["metal"], ["metal", "rock", "jazz"]):
+            with self.subTest(genres=genres):
+                self.assertNotEqual(self.render("{% genre_nav genres %}", genres=genres), html)
+                self.assertEqual(self.render_to_string.call_count, 1)
+
+
+class DeadlineTests(SimpleTestCase):
+    def test_timeout_is_capped_by_what_is_left(self):
+        with mock.patch("WebApplication.deadline.time.monotonic", return_value=100.0):
+            deadline = Deadline(2.0)
+        with mock.patch("WebApplication.deadline.time.monotonic", return_value=101.5):
+            self.assertAlmostEqual(deadline.remaining(), 0.5)
+            self.assertAlmostEqual(deadline.timeout(10), 0.5)
+            self.assertEqual(deadline.timeout(0.2), 0.2)
+            self.assertFalse(deadline.expired())
+
+    def test_spent_budget_raises(self):
+        with mock.patch("WebApplication.deadline.time.monotonic", return_value=100.0):
+            deadline = Deadline(1.0)
+        with mock.patch("WebApplication.deadline.time.monotonic", return_value=100.99):
+            self.assertTrue(deadline.expired())
+            with self.assertRaises(DeadlineExceeded):
+                deadline.timeout(10)
+        with mock.patch("WebApplication.deadline.time.monotonic", return_value=105.0):
+            self.assertEqual(deadline.remaining(), 0.0)
+
+
+class ArtistPrefixIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = ArtistPrefixIndex()
+        self.index.add_artists([
+            artist("1", "The Beatles", 90),
+            artist("2", "Beyoncé", 95),
+            artist("3", "Beach House", 70),
+            artist("4", "AC/DC", 85),
+            artist("5", "The The", 40),
+        ])
+
+    def ids(self, query, limit=10):
+        return [entry["id"] for entry in self.index.search(query, limit)]
+
+    def test_normalize_search_text(self):
+        self.assertEqual(normalize_search_text("  Beyoncé "), "beyonce")
+        self.assertEqual(normalize_search_text("AC/DC"), "ac dc")
+        self.assertEqual(normalize_search_text(None), "")
+
+    def test_matches_any_word_most_popular_first(self):
+        self.assertEqual(self.ids("be"), ["2", "1", "3"])
+        self.assertEqual(self.ids("beat"), ["1"])
+        self.assertEqual(self.ids("house"), ["3"])
+        self.assertEqual(self.ids("BEYONCE"), ["2"])
+        self.assertEqual(self.ids("ac dc"), ["4"])
+        self.assertEqual(self.ids("zz"), [])
+        self.assertEqual(self.ids(""), [])
+
+    def test_artist_matching_on_several_words_is_listed_once(self):
+        self.assertEqual(self.ids("the"), ["1", "5"])
+
+    def test_limit(self):
+        self.assertEqual(self.ids("be", limit=2), ["2", "1"])
+
+    def test_renames_and_updates(self):
+        self.assertEqual(self.ids("b"), ["2", "1", "3"])  # cached short-prefix list, patched below
+
+        self.assertEqual(self.index.add_artists([artist("1", "Wings", 90)]), 1)
+        self.assertEqual(self.index.add_artists([artist("1", "Wings", 90)]), 0)
+        self.index.add_artists([artist("3", "Beach House", 99), artist("6", "Bon Iver", 80)])
+
+        self.assertEqual(self.ids("beat"), [])
+        self.assertEqual(self.ids("wing"), ["1"])
+        self.assertEqual(self.ids("b"), ["3", "2", "6"])
+        self.assertEqual(self.ids("be"), ["3", "2"])
+        self.assertEqual(len(self.index), 6)
+
+    def test_incremental_and_bulk_merges_agree_with_a_full_scan(self):
+        rng = random.Random(7)
+        words = ["black", "blue", "bright", "dark", "day", "the", "lil", "dj", "moon", "more"]
+        index = ArtistPrefixIndex()
+        names = {}
+
+        for batch_size in (5, ArtistPrefixIndex.INSORT_LIMIT + 50, 20, 3):
+            batch = []
+            for _ in range(batch_size):
+                artist_id = str(rng.randrange(3000))
+                names[artist_id] = " ".join(rng.sample(words, rng.randint(1, 3))) + f" {artist_id}"
+                batch.append(artist(artist_id, names[artist_id], int(artist_id)))
+            index.add_artists(batch)
+
+            for prefix in ("b", "bl", "da", "the", "moo", "d"):
+                expected = sorted(
+                    (artist_id for artist_id, name in names.items()
+                     if any(word.startswith(prefix) for word in name.split()[:ArtistPrefixIndex.MAX_WORDS_PER_NAME])),
+                    key=int, reverse=True,
+                )[:10]
+                self.assertEqual([entry["id"] for entry in index.search(prefix, 10)], expected, prefix)
+
+
+class RequestProfilerTests(TestCase):
+    def setUp(self):
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        settings_patcher = override_settings(REQUEST_PROFILER_DIR=output_dir)
+        settings_patcher.enable()
+        self.addCleanup(settings_patcher.disable)
+
+        self.output_dir = output_dir
+        self.middleware = RequestProfilerMiddleware(lambda request: HttpResponse("ok"))
+        User = get_user_model()
+        User.objects.create_user("admin", is_staff=True)
+        User.objects.create_user("fan")
+
+    def profile(self, token, mode="cprofile"):
+        request = RequestFactory().get("/about/", HTTP_X_PROFILE=token, HTTP_X_PROFILE_MODE=mode)
+        return self.middleware(request)
+
+    def test_requests_without_a_token_are_passed_straight_through(self):
+        request = RequestFactory().get("/?genre_name=metal")
+        response = HttpResponse("ok")
+        middleware = RequestProfilerMiddleware(lambda request: response)
+        with mock.patch("WebApplication.middleware.check_profile_token") as check_profile_token:
+            self.assertIs(middleware(request), response)
+        check_profile_token.assert_not_called()
+        self.assertNotIn("GET", request.__dict__)  # the query string wasn't even parsed
+
+    def test_staff_token_profiles_the_request(self):
+        for mode, extension in (("cprofile", ".prof"), ("sample", ".collapsed")):
+            with self.subTest(mode=mode):
+                response = self.profile(make_profile_token("admin"), mode)
+
+                self.assertTrue(response["X-Profile-File"].endswith(extension))
+                self.assertTrue(os.path.exists(os.path.join(self.output_dir, response["X-Profile-File"])))
+                self.assertIn("no-store", response["Cache-Control"])
+
+    def test_invalid_tokens_are_ignored(self):
+        token = make_profile_token("admin")
+        with mock.patch("django.core.signing.time.time", return_value=time.time() - 2 * settings.REQUEST_PROFILER_TOKEN_MAX_AGE):
+            expired = make_profile_token("admin")
+
+        for name, bad_token in (
+            ("tampered", token[:-1] + ("A" if token[-1] != "A" else "B")),
+            ("expired", expired),
+            ("other salt", signing.dumps({"staff": "admin"})),
+            ("not a profile token", signing.dumps({"user": "admin"}, salt=PROFILE_TOKEN_SALT)),
+            ("not staff", make_profile_token("fan")),
+            ("no such user", make_profile_token("ghost")),
+            ("unknown mode", token),
+        ):
+            with self.subTest(name), self.assertLogs("WebApplication.middleware", "WARNING"):
+                response = self.profile(bad_token, mode="trace" if name == "unknown mode" else "cprofile")
+                self.assertNotIn("X-Profile-File", response)
+        self.assertEqual(os.listdir(self.output_dir), [])
+
+    def test_same_route_in_the_same_second_gets_separate_files(self):
+        with mock.patch("WebApplication.profiling.time.strftime", return_value="20261019-142501"):
+            names = {profile_filename("GET", "artist/<str:id>/", 0.845, "prof") for _ in range(2)}
+        self.assertEqual(len(names), 2)
+        self.assertTrue(all(name.startswith("20261019-142501_GET_artist-str-id_845ms_") for name in names))
+
+
+class AccessTrackerTests(SimpleTestCase):
+    def setUp(self):
+        self.tracker = AccessTracker()
+
+    def test_positions_are_one_per_row(self):
+        positions = self.tracker.positions("artist_details:abc")
+        self.assertEqual(len(positions), AccessTracker.DEPTH)
+        for row, position in enumerate(positions):
+            self.assertTrue(row * AccessTracker.WIDTH <= position < (row + 1) * AccessTracker.WIDTH)
+        self.assertEqual(positions, self.tracker.positions("artist_details:abc"))
+
+    def test_record_estimates_reads_from_both_windows(self):
+        pipeline = mock.Mock()
+        # current window (one counter per row), EXPIRE, previous window
+        pipeline.execute.return_value = [[5, 7, 6, 9, 1, 1, 2, 1], True, [10, 4, 8, 8, 0, 0, 0, 0]]
+
+        with mock.patch("WebApplication.services.access_tracker.get_redis_connection") as connection:
+            connection.return_value.pipeline.return_value = pipeline
+            reads = self.tracker.record(["a", "b"], stats={"family:hits": 1})
+
+        self.assertEqual(reads, {"a": 5 + 4 // 2, "b": 1})
+        pipeline.hincrby.assert_called_once_with(AccessTracker.STATS_KEY, "family:hits", 1)
+
+    def test_estimate_reads_without_counting(self):
+        pipeline = mock.Mock()
+        pipeline.execute.return_value = [[5, 7, 6, 9], [10, 4, 8, 8]]
+
+        with mock.patch("WebApplication.services.access_tracker.get_redis_connection") as connection:
+            connection.return_value.pipeline.return_value = pipeline
+            self.assertEqual(self.tracker.estimate(["a"]), {"a": 5 + 4 // 2})
+
+        for call in pipeline.execute_command.call_args_list:
+            self.assertNotIn("INCRBY", call.args)
+        pipeline.expire.assert_not_called()
+
+    def test_record_returns_nothing_when_redis_is_down(self):
+        with mock.patch(
+            "WebApplication.services.access_tracker.get_redis_connection", side_effect=ConnectionError("down")
+        ):
+            self.assertEqual(self.tracker.record(["a"]), {})
+
+    def test_count_rides_along_with_the_request_writes(self):
+        backend = PipelinedCache()
+        request_writes = RequestCache(backend)
+        token = activate(request_writes)
+        try:
+            self.tracker.count(["a", "b"], stats={"family:hits": 2})
+        finally:
+            deactivate(token)
+        self.assertEqual(backend.round_trips, 0)
+
+        request_writes.flush()
+
+        self.assertEqual(backend.round_trips, 1)
+        commands = backend.pipelines[0].commands
+        self.assertEqual([command[0] for command in commands], ["command", "expire", "hincrby"])
+        self.assertEqual(commands[0][1], "BITFIELD")
+        self.assertEqual(commands[0][4:].count("INCRBY"), 2 * AccessTracker.DEPTH)
+        self.assertEqual(commands[2], ("hincrby", AccessTracker.STATS_KEY, "family:hits", 2))
+
+
+class RequestCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.backend = PipelinedCache()
+        self.cache = RequestCache(self.backend)
+
+    def test_reads_are_memoised_misses_included(self):
+        self.backend.store.set("hit", 1)
+
+        self.assertEqual(self.cache.get("hit"), 1)
+        self.assertEqual(self.cache.get("hit"), 1)
+        self.assertIsNone(self.cache.get("miss"))
+        self.assertEqual(self.cache.get("miss", "default"), "default")
+        self.assertEqual(self.backend.round_trips, 2)
+
+    def test_prefetch_reads_everything_in_one_round_trip(self):
+        self.backend.store.set_many({"a": 1, "b": 2})
+
+        self.cache.prefetch(["a", "b", "c", "a"])
+        self.assertEqual(self.cache.get_many(["a", "b", "c"]), {"a": 1, "b": 2})
+        self.assertEqual(self.cache.get("c", "none"), "none")
+        self.assertEqual(self.backend.round_trips, 1)
+
+    def test_writes_are_visible_at_once_but_sent_in_one_pipeline(self):
+        self.backend.store.set("old", "value")
+
+        self.cache.set("a", 1, timeout=60)
+        self.cache.set_many({"b": 2, "c": 3}, timeout=60)
+        self.cache.touch("a", 120)
+        self.cache.delete("old")
+        self.cache.defer(lambda pipeline: pipeline.hincrby("stats", "hits", 1))
+
+        self.assertEqual(self.cache.get_many(["a", "b", "c", "old"]), {"a": 1, "b": 2, "c": 3})
+        self.assertIsNone(self.backend.store.get("a"))
+        self.assertEqual(self.backend.round_trips, 0)
+
+        self.cache.flush()
+
+        self.assertEqual(self.backend.round_trips, 1)
+        self.assertEqual(len(self.backend.pipelines), 1)
+        self.assertEqual(
+            [command[0] for command in self.backend.pipelines[0].commands],
+            ["set", "set", "set", "touch", "delete", "hincrby"],
+        )
+        self.assertEqual(self.backend.store.get_many(["a", "b", "c", "old"]), {"a": 1, "b": 2, "c": 3})
+
+    def test_flush_without_writes_is_free(self):
+        self.cache.get("a")
+        self.cache.flush()
+        self.assertEqual(self.backend.pipelines, [])
+
+    def test_add_is_synchronous(self):
+        self.assertTrue(self.cache.add("lock", 1, timeout=60))
+        self.assertFalse(self.cache.add("lock", 2, timeout=60))
+        self.assertEqual(self.backend.store.get("lock"), 1)
+        self.assertEqual(self.cache.get("lock"), 1)
+
+    def test_without_redis_writes_are_applied_one_by_one(self):
+        backend = LocMemCache("tests-plain", {})
+        plain = RequestCache(backend)
+        plain.set("a", 1)
+        plain.set_many({"b": 2})
+        plain.defer(lambda pipeline: self.fail("raw commands need Redis"))
+        plain.flush()
+        self.assertEqual(backend.get_many(["a", "b"]), {"a": 1, "b": 2})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RequestCacheMiddlewareTests(SimpleTestCase):
+    def test_view_writes_reach_the_cache_when_the_request_ends(self):
+        seen = {}
+
+        def view(request):
+            request_cache.set("written", "yes", timeout=60)
+            seen["in_request"] = request_cache.get("written")
+            seen["shared"] = request_cache.backend.get("written")
+            return HttpResponse("ok")
+
+        RequestCacheMiddleware(view)(RequestFactory().get("/"))
+
+        self.assertEqual(seen, {"in_request": "yes", "shared": None})
+        self.assertEqual(request_cache.get("written"), "yes")
+
+    def test_writes_are_flushed_when_the_view_raises(self):
+        def view(request):
+            request_cache.set("before_error", 1, timeout=60)
+            raise RuntimeError("boom")
+
+        with self.assertRaises(RuntimeError):
+            RequestCacheMiddleware(view)(RequestFactory().get("/"))
+        self.assertEqual(request_cache.get("before_error"), 1)
+
+    def test_proxy_outside_a_request_is_the_plain_cache(self):
+        request_cache.set("plain", 1, timeout=60)
+        request_cache.prefetch(["plain"])  # no-op
+        self.assertEqual(request_cache.get("plain"), 1)
+
+
+def artist(artist_id, name, popularity):
+    return {"spotify_id": artist_id, "name": name, "popularity": popularity, "image_url": None}
+
+
+def spotify_artist(artist_id, name):
+    return {"id": artist_id, "name": name, "genres": [], "popularity": 1, "images": [], "followers": {"total": 1}}
@@ -8,5 +8,7 @@ urlpatterns = [
     path('callback/', views.spotify_callback, name='spotify_callback'),
     path('home/', views.home_view, name='home'),
     path('artist/<str:id>/', views.artist_view, name='artist'),
-    path('about/', views.about_view, name='about')
+    path('about/', views.about_view, name='about'),
+    path('search/artists/', views.artist_search_view, name='artist_search'),
+    path('ready/', views.readiness_view, name='ready'),
 ]
@@ -1,6 +1,14 @@
 from django.shortcuts import render
 from django.shortcuts import redirect
-from .services.spotify_service import SpotifyService, NoArtistsFound, SpotifyServiceError
+from django.http import JsonResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import urlencode
+from .services.spotify_service import SpotifyService, NoArtistsFound, SpotifyServiceError, InvalidGenre
+from .clients.spotify import SpotifyAPIError
+from .deadline import Deadline, DeadlineExceeded
+from .warmup import warmup_status
+from .tasks import PREFETCH_WAIT, queue_prefetch_user_data, wait_for_prefetch
+import hashlib
 import logging
 from django.conf import settings
 
@@ -39,24 +47,53 @@ def spotify_callback(request):
 
     request.session['is_spotify_authenticated'] = True
 
+    # Warm the caches home_view is about to read, while the redirect happens
+    try:
+        queue_prefetch_user_data(token_data['access_token'])
+    except Exception:
+        logger.exception("Could not queue prefetch_user_data - home will fetch synchronously")
+
     return redirect('home')
 
 
 # for non-authenticated users
 def landing_view(request):
-    genre_name = request.GET.get('genre_name', 'metal') # Default genre
+    # One or more genres - ?genre_name=metal&genre_name=jazz
+    selected_genres = request.GET.getlist('genre_name') or ['metal'] # Default genre
     artists = []
+    related_genres = []
+    missing_genres = []
+    failed_genres = []
     error_message = None
-
-    access_token = spotify_service.get_access_token(request)
+    partial_content = False
+    deadline = Deadline(settings.REQUEST_DEADLINES["landing"])
 
     try:
-        artist_ids = spotify_service.get_artists_by_genre(genre_name, access_token)
-        
-        artists = spotify_service.get_artists_details_bulk(artist_ids, access_token)
+        # Validate before anything else - junk genres never reach Spotify or the cache
+        selected_genres = spotify_service.normalize_genre_selection(selected_genres)
+
+        # One round trip for the cache reads below
+        spotify_service.prefetch_page(selected_genres, client_token=not spotify_service.is_authenticated(request))
+
+        related_genres = spotify_service.get_related_genres_for_selection(selected_genres)
+
+        access_token = spotify_service.get_access_token(request, deadline)
+
+        result = spotify_service.get_artists_for_genres(selected_genres, access_token, deadline)
+        artists = result["artists"]
+        missing_genres = result["missing_genres"]
+        failed_genres = result["failed_genres"]
+        partial_content = result["partial"]
+
+    except DeadlineExceeded:
+        partial_content = True
+
+    except InvalidGenre:
+        selected_genres = [genre_name[:SpotifyService.GENRE_MAX_LENGTH] for genre_name in selected_genres]
+        error_message = "That doesn't look like a genre name. Pick one from the list."
 
     except NoArtistsFound:
-        error_message = f"No artists found for the genre '{genre_name}'. Try another genre."
+        error_message = f"No artists found for the genre '{' + '.join(selected_genres)}'. Try another genre."
 
     except SpotifyServiceError:
         error_message = "Sorry! We’re having trouble fetching artists from Spotify right now."
@@ -67,12 +104,18 @@ def landing_view(request):
     # these are baked-in, not fetched from Spotify
     genres = spotify_service.GENRE_SEEDS
 
-    return render(request, "WebApplication/landing.html", {
+    response = render(request, "WebApplication/landing.html", {
         "artists": artists,
         "genres": genres,
-        "genre": genre_name,
-        "error_message": error_message
+        "genre": " + ".join(selected_genres),
+        "related_genres": related_genres,
+        "missing_genres": missing_genres,
+        "failed_genres": failed_genres,
+        "selection_query": selection_query(selected_genres),
+        "error_message": error_message,
+        "partial_content": partial_content,
     })
+    return set_public_cache_headers(request, response, shareable=not (error_message or partial_content))
 
 
 # for authenticated users
@@ -81,75 +124,196 @@ def home_view(request):
     if not request.session.get("is_spotify_authenticated"):
         return redirect("landing")
 
+    deadline = Deadline(settings.REQUEST_DEADLINES["home"])
+    partial_content = False
+
     access_token = request.session.get("spotify_access_token")
     if not access_token:
-        access_token = spotify_service.get_access_token(request) # this function will get access token, or refresh it if needed.
+        try:
+            access_token = spotify_service.get_access_token(request, deadline) # this function will get access token, or refresh it if needed.
+        except DeadlineExceeded:
+            # Spotify's token endpoint is slow - nothing can be fetched without a token, render the page shell
+            return render_home(request, partial_content=True)
+        except (SpotifyServiceError, SpotifyAPIError) as e:
+            logger.warning(f"Could not refresh the user's access token, re-authenticating: {str(e)}")
+            return redirect("spotify_login")
+
+    # Right after login the prefetch task is filling the caches read below - give it a moment
+    # rather than make every Spotify call a second time
+    if not wait_for_prefetch(access_token, min(PREFETCH_WAIT, deadline.remaining())):
+        logger.info("Prefetch of user data still running - home fetches what it needs itself")
 
     user_profile = None
     genres = []
     artists = []
-    selected_genre = None
+    related_genres = []
+    missing_genres = []
+    failed_genres = []
+    selected_genres = []
     error_message = None
 
     # --- Fetch user profile ---
     try:
-        user_profile = spotify_service.get_user_profile(access_token)
+        user_profile = spotify_service.get_user_profile(access_token, deadline)
+    except DeadlineExceeded:
+        partial_content = True  # Spotify is slow, not the user's fault - render without the profile
     except SpotifyServiceError:
         return redirect("landing")  # Must have profile
 
     # --- Fetch user’s top genres ---
     try:
-        top_genres = spotify_service.get_user_top_genres(access_token)
+        top_genres, genres_partial = spotify_service.get_user_top_genres(
+            access_token, user_id=user_profile["id"] if user_profile else None, deadline=deadline
+        )
         genres = top_genres if top_genres else []
+        partial_content = partial_content or genres_partial
+    except DeadlineExceeded:
+        genres = []
+        partial_content = True
     except SpotifyServiceError:
         genres = []
         error_message = "Couldn’t load your top genres."
 
-    # --- Determine selected genre ---
-    selected_genre = request.GET.get("genre_name")
-    if not selected_genre:
+    # --- Determine selected genres (one or more ?genre_name=) ---
+    selected_genres = request.GET.getlist("genre_name")
+    if not selected_genres:
         # First load: default to most played genre
-        selected_genre = genres[0] if genres else None
+        selected_genres = genres[:1]
 
-    # --- Fetch artists for selected genre ---
-    if selected_genre:
+    # --- Fetch artists for selected genres ---
+    if selected_genres:
         try:
-            artist_ids = spotify_service.get_artists_by_genre(selected_genre, access_token)
-            artists = spotify_service.get_artists_details_bulk(artist_ids, access_token)
+            selected_genres = spotify_service.normalize_genre_selection(selected_genres)
+            spotify_service.prefetch_page(selected_genres)
+            related_genres = spotify_service.get_related_genres_for_selection(selected_genres)
+            result = spotify_service.get_artists_for_genres(selected_genres, access_token, deadline)
+            artists = result["artists"]
+            missing_genres = result["missing_genres"]
+            failed_genres = result["failed_genres"]
+            partial_content = partial_content or result["partial"]
+        except DeadlineExceeded:
+            partial_content = True
+        except InvalidGenre:
+            selected_genres = [genre_name[:SpotifyService.GENRE_MAX_LENGTH] for genre_name in selected_genres]
+            error_message = "That doesn't look like a genre name. Pick one from the list."
         except NoArtistsFound:
-            error_message = f"No artists found for: {selected_genre}"
+            error_message = f"No artists found for: {', '.join(selected_genres)}"
         except SpotifyServiceError:
             error_message = "Couldn’t load artists for this genre."
 
+    return render_home(
+        request,
+        user_profile=user_profile,
+        genres=genres,
+        artists=artists,
+        selected_genres=selected_genres,
+        related_genres=related_genres,
+        missing_genres=missing_genres,
+        failed_genres=failed_genres,
+        error_message=error_message,
+        partial_content=partial_content,
+    )
+
+
+def render_home(request, user_profile=None, genres=(), artists=(), selected_genres=(), related_genres=(),
+                missing_genres=(), failed_genres=(), error_message=None, partial_content=False):
     return render(request, "WebApplication/home.html", {
         "user_profile": user_profile,
         "genres": genres,
         "artists": artists,
-        "top_genre": selected_genre,  # 🔥 use actual selected genre
+        "top_genre": " + ".join(selected_genres),  # 🔥 use actual selected genres
+        "related_genres": related_genres,
+        "missing_genres": missing_genres,
+        "failed_genres": failed_genres,
+        "selection_query": selection_query(selected_genres),
         "error_message": error_message,
+        "partial_content": partial_content,
     })
 
 # NOTE: After dealing with tokens, check this - could be useful. Might be a missed detail on my part.
 def artist_view(request, id):
     artist = None
     error_message = None
-    access_token = spotify_service.get_access_token(request)
+    deadline = Deadline(settings.REQUEST_DEADLINES["artist"])
 
     # NOTE: we have a bulk list of artists details within both landing and home views
     # so we can use that to get the artist details, instead of calling service again.
     try:
-        artist = spotify_service.get_artist_details(id, access_token)
+        spotify_service.prefetch_page(artist_ids=[id], client_token=not spotify_service.is_authenticated(request))
+        access_token = spotify_service.get_access_token(request, deadline)
+        artist = spotify_service.get_artist_details(id, access_token, deadline)
+    except DeadlineExceeded:
+        error_message = "Spotify is responding slowly right now. Please try again in a moment."
     except SpotifyServiceError as e:
         error_message = "Sorry! We couldn’t load this artist’s details right now."
     except Exception as e:
         error_message = "An unexpected error occurred while loading the artist page."
 
-    return render(request, "WebApplication/artist.html", {
+    response = render(request, "WebApplication/artist.html", {
         "artist": artist,
         "error_message": error_message
     })
+    return set_public_cache_headers(request, response, shareable=not error_message)
+
+
+# Type-ahead endpoint: /search/artists/?q=<prefix> -> {"query": ..., "results": [{"id", "name", "popularity", "image_url"}]}
+def artist_search_view(request):
+    query = request.GET.get("q", "")[:SpotifyService.ARTIST_SEARCH_MAX_LENGTH]
+    deadline = Deadline(settings.REQUEST_DEADLINES["artist_search"])
+
+    try:
+        results, degraded = spotify_service.search_artists(query, request, search_client_key(request), deadline=deadline)
+    except Exception:
+        logger.exception("Unexpected error in artist_search_view()")
+        results, degraded = [], True
+
+    response = JsonResponse({"query": query, "results": results})
+    # Debounced / Spotify-failed answers are local-only - fine for this keystroke, not for everyone else's
+    return set_public_cache_headers(request, response, shareable=bool(results) and not degraded)
+
+
+# Who type-ahead searches are throttled by: the session, or - sessions aren't loaded for anonymous users - the
+    # client's address. Hashed, so neither a session id nor an address ends up in a Redis key.
+def search_client_key(request):
+    client = request.COOKIES.get(settings.SESSION_COOKIE_NAME) or client_address(request)
+    return hashlib.sha256(client.encode()).hexdigest()[:32]
+
+
+# The visitor's address. Behind nginx REMOTE_ADDR is the proxy's, so it's the X-Forwarded-For entry added by
+    # the outermost of our TRUSTED_PROXY_COUNT proxies - entries left of it are whatever the client sent.
+def client_address(request):
+    forwarded = [address.strip() for address in request.META.get("HTTP_X_FORWARDED_FOR", "").split(",") if address.strip()]
+    if settings.TRUSTED_PROXY_COUNT and len(forwarded) >= settings.TRUSTED_PROXY_COUNT:
+        return forwarded[-settings.TRUSTED_PROXY_COUNT]
+    return request.META.get("REMOTE_ADDR", "")
 
 
 # some info for the clueless - oo-ooh, why did u do this blabla
 def about_view(request):
-    return render(request, 'WebApplication/about.html')
+    response = render(request, 'WebApplication/about.html')
+    return set_public_cache_headers(request, response)
+
+
+# Query string of the current genre selection, for "add this genre" links - empty once the selection is full.
+def selection_query(selected_genres):
+    if len(selected_genres) >= SpotifyService.MAX_SELECTED_GENRES:
+        return ""
+    return urlencode({"genre_name": selected_genres}, doseq=True)
+
+
+# Anonymous pages carry nothing per-user (no session is loaded for them), so nginx / a CDN may share them.
+    # Logged-in responses stay private; error pages aren't shared so a Spotify hiccup isn't cached for everyone.
+def set_public_cache_headers(request, response, shareable=True):
+    if spotify_service.is_authenticated(request):
+        patch_cache_control(response, private=True)
+    elif shareable:
+        patch_cache_control(response, public=True, max_age=settings.PUBLIC_PAGE_MAX_AGE)
+    else:
+        patch_cache_control(response, no_cache=True)
+    return response
+
+
+# Readiness probe - 503 until the shared caches (and this worker) have been warmed up (see warmup.py / gunicorn.conf.py).
+def readiness_view(request):
+    status = warmup_status()
+    return JsonResponse(status, status=200 if status["ready"] else 503)
@@ -0,0 +1,128 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import get_template
+from django.urls import get_resolver
+
+from .deadline import Deadline
+
+logger = logging.getLogger(__name__)
+
+# Templates compiled up front, so the cached template loader is hot before the first request
+HOT_TEMPLATES = [
+    "WebApplication/landing.html",
+    "WebApplication/home.html",
+    "WebApplication/artist.html",
+    "WebApplication/about.html",
+]
+
+# Per-process warm-up state, reported by the /ready/ endpoint. "managed" is set by the gunicorn hooks
+# (inherited by the forked workers); without them (runserver, serve.py) there is no warm-up to wait for.
+_state = {
+    "ready": False,
+    "managed": False,
+    "started_at": None,
+    "finished_at": None,
+    "errors": [],
+}
+
+# Set in Redis when the master's shared-cache warm-up has finished - {"finished_at", "errors"}
+SHARED_WARMUP_KEY = "warmup:shared"
+
+
+# Called once in the gunicorn master (`when_ready` hook) before any worker is forked.
+    # Fills the shared Redis cache with the client token and the hot genre/artist data, then drops
+    # the HTTP connections that were opened - sockets must not be inherited by the forked workers.
+    # Spotify gets WARMUP_DEADLINE seconds in all, so a slow API can't hold up worker boot and readiness.
+def warm_up_shared_caches():
+    from .views import spotify_service
+
+    logger.info("Warming shared caches (client token, seed genres, artist details)")
+    _state["managed"] = True
+    started = time.monotonic()
+    errors = []
+    deadline = Deadline(settings.WARMUP_DEADLINE)
+
+    try:
+        cache.delete(SHARED_WARMUP_KEY)  # the previous deployment's
+        access_token = spotify_service.client.get_client_access_token(deadline)
+        spotify_service.warm_genre_caches(access_token, deadline)
+        # Built once, before the fork - every worker starts with the index (shared copy-on-write)
+        # and its refresher thread only adds what was cached after this
+        spotify_service.refresh_artist_search_index()
+    except Exception as e:
+        logger.exception("Shared cache warm-up failed - workers will fill caches on demand")
+        errors.append(str(e))
+    finally:
+        spotify_service.client.close()
+
+    try:
+        cache.set(SHARED_WARMUP_KEY, {"finished_at": time.time(), "errors": errors}, timeout=None)
+    except Exception:
+        logger.exception("Could not record the shared cache warm-up - /ready/ will report it as not done")
+
+    logger.info(f"Shared cache warm-up finished in {time.monotonic() - started:.2f}s")
+
+
+# Called in every worker (`post_worker_init` hook) before it accepts traffic.
+    # Compiles templates, builds the URL resolver and opens this worker's own Redis and Spotify connections.
+def warm_up_worker():
+    _state["started_at"] = time.time()
+    _state["errors"] = []
+
+    steps = [
+        ("url resolver", lambda: get_resolver().url_patterns),
+        ("templates", lambda: [get_template(name) for name in HOT_TEMPLATES]),
+        ("redis", lambda: cache.get("warmup:ping")),
+        ("client token", warm_client_token),
+        ("spotify connections", open_spotify_connections),
+    ]
+
+    for name, step in steps:
+        try:
+            step()
+        except Exception as e:
+            logger.exception(f"Warm-up step '{name}' failed")
+            _state["errors"].append(f"{name}: {str(e)}")
+
+    _state["finished_at"] = time.time()
+    _state["ready"] = True
+
+    logger.info(
+        f"Worker warm-up finished in {_state['finished_at'] - _state['started_at']:.2f}s "
+        f"with {len(_state['errors'])} error(s)"
+    )
+
+
+def warm_client_token():
+    from .views import spotify_service
+
+    spotify_service.client.get_client_access_token()
+
+
+def open_spotify_connections():
+    from .views import spotify_service
+
+    spotify_service.client.open_connections()
+
+
+# Ready when this process has warmed up and so have the shared caches (a flag in Redis, so it holds for every
+    # worker and container). Outside gunicorn nothing runs the warm-up hooks - the process is ready as it is.
+def warmup_status():
+    """
+    Return a copy of this process' warm-up state, with the shared warm-up's under "shared".
+    """
+    status = {**_state, "errors": list(_state["errors"])}
+    if not _state["managed"]:
+        status["ready"] = True
+        return status
+
+    try:
+        status["shared"] = cache.get(SHARED_WARMUP_KEY)
+    except Exception as e:
+        status["shared"] = None
+        status["errors"].append(f"shared warm-up state: {str(e)}")
+    status["ready"] = _state["ready"] and status["shared"] is not None
+    return status
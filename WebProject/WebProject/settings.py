@@ -43,6 +43,10 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'WebApplication.tasks.refresh_client_token',
         'schedule': crontab(minute=0),  # every hour
     },
+    'update_genre_index': {
+        'task': 'WebApplication.tasks.update_genre_index',
+        'schedule': crontab(minute='*/15'),  # incremental, new artists only
+    },
 }
 
 # SECURITY WARNING: don't run with debug turned on in production!
@@ -62,7 +66,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'WebApplication.middleware.RequestProfilerMiddleware',  # first, so a profile covers the whole stack
+    'WebApplication.middleware.RequestCacheMiddleware',  # batches the request's Redis reads / writes
     'django.middleware.security.SecurityMiddleware',
+    'WebApplication.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -71,6 +78,32 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Response compression / HTML minification (WebApplication.middleware.CompressionMiddleware)
+RESPONSE_MINIFY_HTML = True
+RESPONSE_COMPRESSION_MIN_SIZE = 860                 # bytes - below this the headers cost more than we save
+RESPONSE_COMPRESSION_BROTLI_QUALITY = 4             # fast dynamic setting, static files get quality 11 at collectstatic
+RESPONSE_COMPRESSION_GZIP_LEVEL = 6
+RESPONSE_COMPRESSION_BREACH_MAX_RANDOM_BYTES = 100  # padding for pages carrying a CSRF token (gzip only, never brotli)
+
+# Cache-Control max-age for anonymous public pages (landing, artist, about) - lets nginx / a CDN share them
+PUBLIC_PAGE_MAX_AGE = 60 * 5
+
+# Reverse proxies in front of gunicorn that append to X-Forwarded-For - nginx with
+# `proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;`. 0 = none, REMOTE_ADDR is the client.
+TRUSTED_PROXY_COUNT = env.int('TRUSTED_PROXY_COUNT', default=1)
+
+# Time budget per view (seconds) - every Spotify call gets what's left of it, past it the page renders with what it has.
+# Kept well under the gunicorn worker timeout (60s).
+REQUEST_DEADLINES = {
+    "landing": 3.0,
+    "home": 5.0,
+    "artist": 2.5,
+    "artist_search": 1.0,
+}
+
+# Spotify's share of the gunicorn master's warm-up (warmup.py) - seed genres not reached by then are cached on demand
+WARMUP_DEADLINE = 20.0
+
 ROOT_URLCONF = 'WebProject.urls'
 
 TEMPLATES = [
@@ -84,6 +117,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'WebApplication.context_processors.spotify_auth',
             ],
         },
     },
@@ -115,7 +149,16 @@ CACHES = {
         'OPTIONS': {
             'CLIENT_CLASS': 'django_redis.client.DefaultClient',
         }
-    }
+    },
+    # Process-local cache of rendered template fragments (artist cards, genre nav) - see templatetags/fragments.py
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'rendered-fragments',
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        }
+    },
 }
 
 
@@ -138,6 +181,17 @@ STATIC_URL = '/static/'
 
 STATIC_ROOT = env('STATIC_ROOT', default=os.path.join(BASE_DIR, 'staticfiles'))
 
+# collectstatic writes content-hashed files (safe for far-future cache headers),
+# woff2 fonts and .gz/.br precompressed variants - see WebApplication/storage.py
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "WebApplication.storage.CompressedManifestStaticFilesStorage",
+    },
+}
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
@@ -151,6 +205,11 @@ LOG_DIR = os.path.join(BASE_DIR, 'logs')
 if not os.path.exists(LOG_DIR):
     os.makedirs(LOG_DIR)  # Create logs directory if it doesn't exist
 
+# On-demand request profiling for staff (WebApplication.middleware.RequestProfilerMiddleware)
+REQUEST_PROFILER_DIR = os.path.join(LOG_DIR, 'profiles')
+REQUEST_PROFILER_TOKEN_MAX_AGE = 60 * 60 * 24  # tokens from `manage.py profile_token` are valid for a day
+REQUEST_PROFILER_SAMPLE_INTERVAL = 0.001       # seconds between stack samples in "sample" mode
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
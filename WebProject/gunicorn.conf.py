@@ -0,0 +1,28 @@
+# Production gunicorn settings - `gunicorn -c gunicorn.conf.py` (from the Django project root).
+#
+# preload_app loads Django once in the master, so workers fork with apps, settings and views already imported.
+# The hooks below then warm everything else before a worker accepts its first request:
+#   when_ready        (master, once)   -> client token + seed genres/artists into Redis, artist search index
+#   post_worker_init  (every worker)   -> templates, URL resolver, own Redis/Spotify connections
+# /ready/ returns 503 until the shared warm-up has been recorded in Redis (and the answering worker is warm).
+
+wsgi_app = "WebProject.wsgi:application"
+bind = "0.0.0.0:8000"
+workers = 4
+
+preload_app = True
+
+# Warm-up of the shared caches can take a few seconds on a cold Redis
+timeout = 60
+
+
+def when_ready(server):
+    from WebApplication.warmup import warm_up_shared_caches
+
+    warm_up_shared_caches()
+
+
+def post_worker_init(worker):
+    from WebApplication.warmup import warm_up_worker
+
+    warm_up_worker()
@@ -4,22 +4,23 @@ echo "🚀 Starting deployment..."
 
 cp "$SPOTIFY_ENV_PATH" .env
 
-echo "🗑 Clearing host static files..."
-rm -rf /var/www/webapp/static
+echo "📁 Preparing the host static directory..."
 mkdir -p /var/www/webapp/static
 chown -R http:http /var/www/webapp/static
 
+# The web container clears and repopulates the static files itself before it starts gunicorn
 echo "🐳 Rebuilding and starting Docker..."
 docker compose -f docker-compose.prod.yml up --build -d
-
-echo "🎨 Running collectstatic in the container..."
-docker exec django_web_prod python3 manage.py collectstatic --noinput
-echo "✅ Static files populated and container running."
+echo "✅ Containers running."
 
 echo "🔄 Applying database migrations..."
 docker exec django_web_prod python3 manage.py migrate --noinput
 echo "🔄 Database migrations applied."
 
+echo "🔥 Waiting for the app to finish warming up..."
+docker exec django_web_prod python3 manage.py wait_ready --timeout 180
+echo "✅ App is warm and ready."
+
 echo "🔄 Restarting Nginx..."
 systemctl restart nginx
 